@@ -2,11 +2,15 @@ import json
 import re
 import os
 import sys
+import multiprocessing
+import functools
+import collections
 from glob import glob
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
 from matplotlib.gridspec import GridSpec
+from shard import ShardReader, get_shard_path
 
 
 def analyze_api_evolution(docs:dict, MIN_VERSION, MAX_VERSION):
@@ -173,6 +177,13 @@ def test_serial():
     print(python_obj['api'])  
 
 
+# Normalized strings repeat across submodules and versions (e.g. `impl<T> From<T> for T`, unstable banners),
+# so normalization is memoized by the raw string, in caches of bounded size.
+NORMALIZE_CACHE_SIZE = 2**16
+SPACES_PATTERN = re.compile(' +')
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def get_pure_string(string: str) -> str:
     '''
     Remove all special characters from a string.
@@ -181,12 +192,30 @@ def get_pure_string(string: str) -> str:
     string = string.replace(u'\xa0', u' ')
     string = string.replace(u'=', u' = ')
     string = string.replace(u'= =', u'==')
-    string = re.sub(' +',' ',string)
+    string = SPACES_PATTERN.sub(' ',string)
     if string[-2:] == ', ':
         string = string[0:-2]
     return string
 
 
+def strip_notable_traits(string: str) -> str:
+    '''
+    Remove `\u24d8` and the notable-trait info following it.
+    '''
+    return string.split('\u24d8')[0]
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def get_plain_api(api: str) -> str:
+    '''
+    Normalize an api of a function, see `recover_info()`.
+    '''
+    api = strip_notable_traits(api)
+    api = api.replace('pub ', '') # All analyzed APIs are public, whether marked or not.
+    api = api.replace('default ', '') # `Default` keyword does not affect API.
+    return get_pure_string(api)
+
+
 
 def empty_stability():
     return {
@@ -196,6 +225,8 @@ def empty_stability():
         'full': '',
     }
 
+STABILITY_KEYS = empty_stability().keys()
+
 def empty_api():
     return {
         'submodule': '',
@@ -205,8 +236,160 @@ def empty_api():
         'stability': list(),
         'next_api_index': -1, # Index of the same abi in next doc version in the same submodule. 
         'duration': 0, # Duration of the same abi (in versions)
+        'flags': 0, # API_* flags of `stability`, see `get_stability_flags()`
+        'rufs': list(), # Sorted features (RUF) of unstable items of `stability`
     }
 
+# Keys of APIs in `all_docs.json`. `flags` and `rufs` are not in files written before they were added.
+API_KEYS = empty_api().keys() - {'flags', 'rufs'}
+
+
+class CompactRecord:
+    '''
+    Record with `__slots__` instead of a dict, read and written like a dict (`record['api']`) by the analysis functions.
+    Subclasses list their fields in `__slots__`. Fields not set (e.g. `version`, set for removed APIs) are not keys.
+    '''
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__slots__ and hasattr(self, key)
+
+    def get(self, key, default = None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def keys(self) -> list:
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    def items(self) -> list:
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    @staticmethod
+    def plain_value(value):
+        return list(value) if isinstance(value, tuple) else sorted(value) if isinstance(value, (frozenset, set)) else value
+
+    def to_dict(self) -> dict:
+        '''
+        Return the record as a dict, as in `all_docs.json` (e.g. `json.dump(docs, file, default=CompactRecord.to_dict)`).
+        '''
+        return {key: CompactRecord.plain_value(value) for (key, value) in self.items()}
+
+    def __eq__(self, other) -> bool:
+        '''
+        Records equal records or dicts with the same fields, as in `all_docs.json` (tuples as lists, sets sorted).
+        '''
+        if isinstance(other, CompactRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == {key: CompactRecord.plain_value(value) for (key, value) in other.items()}
+        return NotImplemented
+
+    # Records are changed in place (e.g. `next_api_index`), so they are not hashable.
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
+class StabilityRecord(CompactRecord):
+    '''
+    Compact `empty_stability()`. Equal stabilities are one shared record, so they must not be changed.
+    '''
+    __slots__ = ('ruf', 'status', 'since', 'full')
+
+
+class ApiRecord(CompactRecord):
+    '''
+    Compact `empty_api()`. Strings are interned, and `stability` is a tuple of `StabilityRecord` shared by equal stabilities.
+    `rufs` is a frozenset of interned features, shared by equal sets.
+    '''
+    __slots__ = ('submodule', 'head', 'impl', 'api', 'stability', 'next_api_index', 'duration', 'flags', 'rufs', 'version')
+
+
+class CompactDocsDecoder:
+    '''
+    `object_hook` of `json.load()` for `all_docs.json`, turning APIs into `ApiRecord` as soon as they are decoded,
+    so that the full dicts of all versions never exist at once. Strings are interned, and equal stabilities are shared.
+    '''
+    def __init__(self):
+        self.stabilities = dict() # -> shared `StabilityRecord` or tuple of them
+        self.rufs = dict() # -> shared frozenset of features
+
+    def make_record(self, record_class, data: dict):
+        record = record_class()
+        for (key, value) in data.items():
+            setattr(record, key, sys.intern(value) if isinstance(value, str) else value)
+        return record
+
+    def __call__(self, data: dict):
+        if data.keys() == STABILITY_KEYS:
+            key = tuple(data.values())
+            if key not in self.stabilities:
+                self.stabilities[key] = self.make_record(StabilityRecord, data)
+            return self.stabilities[key]
+        if data.keys() >= API_KEYS:
+            key = tuple(map(id, data['stability']))
+            if key not in self.stabilities:
+                self.stabilities[key] = tuple(data['stability'])
+            data['stability'] = self.stabilities[key]
+            if 'flags' not in data:
+                data['flags'] = get_stability_flags(data['stability'])
+                data['rufs'] = get_stability_rufs(data['stability'])
+            key = tuple(data['rufs'])
+            if key not in self.rufs:
+                self.rufs[key] = frozenset(map(sys.intern, key))
+            data['rufs'] = self.rufs[key]
+            return self.make_record(ApiRecord, data)
+        return {sys.intern(key): sys.intern(value) if isinstance(value, str) else value for (key, value) in data.items()}
+
+
+def iter_json_array(file, object_hook = None, chunk_size = 2**22):
+    '''
+    Yield items of the json array in `file` one by one, reading the file in chunks, so that only one item is decoded at a time.
+    '''
+    decoder = json.JSONDecoder(object_hook=object_hook)
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Not a json array: ' + file.name)
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            (item, position) = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The item continues in the next chunk. Items larger than a chunk read more at once.
+            chunk = file.read(max(chunk_size, len(buffer) - position))
+            if chunk == '':
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def load_docs(docs_path = 'all_docs.json') -> list:
+    '''
+    Load docs of all versions written by `plain_all_docs()`, with compact APIs (see `CompactDocsDecoder`).
+    Versions are decoded one by one, so the whole file is never in memory either.
+    Alias records (`plain_all_docs(keep_aliases = True)`) are expanded by `resolve_aliases()` as each version is decoded.
+    '''
+    with open(docs_path, 'r') as file:
+        return [resolve_aliases(doc) for doc in iter_json_array(file, CompactDocsDecoder())]
+
+
 def empty_submodule():
     return {
         'kind': '',
@@ -217,60 +400,53 @@ def empty_submodule():
     }
 
 
-# Transfer original raw string into well formatted one.
-def analyze_stability(stability: list) -> list:
+# Stability patterns: (pattern of the item, pattern of the feature in it, how the feature is cut from it).
+# A stability item matching none of them (most are portability items) is skipped by `STABILITY_PATTERN` alone.
+UNSTABLE_PATTERNS = [
+    (re.compile('🔬 This is a nightly-only experimental API\.\s+\(\w+\s#[0-9]+\)'), re.compile('\(\w+\s'), lambda part: part[1:-1]),
+    (re.compile('🔬 This is a nightly-only experimental API\.\s\(\w+\)'), re.compile('\(\w+\)'), lambda part: part.split(' ')[0][1:-1]),
+    # Unstable (wait_timeout_with #27748): unsure if this API is broadly needed or what form it should take\n
+    (re.compile('Unstable \(\w+ #[0-9]+\)'), re.compile('\(\w+ #[0-9]+\)'), lambda part: part.split(' ')[0][1:]),
+    # Unstable (libc): use libc from crates.io\n
+    (re.compile('Unstable \(\w+\)'), re.compile('\(\w+\)'), lambda part: part.split(' ')[0][1:-1]),
+]
+DEPRECATED_PATTERN = re.compile('Deprecated since 1.[0-9]+(?:.[0-9]+)*: .+\n')
+SINCE_PATTERN = re.compile('1.[0-9]+(?:.[0-9]+)*')
+STABILITY_PATTERN = re.compile('nightly-only experimental API|Unstable \(|Deprecated since')
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def analyze_stability_item(item: str) -> tuple:
+    '''
+    Return stabilities (see `empty_stability()`) found in a raw stability item. Callers must copy them before changing them.
+    '''
+    item = get_pure_string(item)
+    if not STABILITY_PATTERN.search(item):
+        return tuple()
     stability_list = list()
-    for item in stability:
-        item = get_pure_string(item)
-        # print(item)
-        # Unstable
-        for matched_unstable in re.findall('🔬 This is a nightly-only experimental API\.\s+\(\w+\s#[0-9]+\)', item):
-            # print('Unstable 1')
-            unstable_part = re.search('\(\w+\s', matched_unstable)[0]
-            ruf = unstable_part[1:-1]
-            new_stability = empty_stability()
-            new_stability['ruf'] = ruf
-            new_stability['status'] = 'unstable'
-            new_stability['full'] = matched_unstable
-            stability_list.append(new_stability)
-        # Unstable 2
-        for matched_unstable in re.findall('🔬 This is a nightly-only experimental API\.\s\(\w+\)', item):
-            # print('Unstable 2')
-            unstable_part = re.search('\(\w+\)', matched_unstable)[0]
-            ruf = unstable_part.split(' ')[0][1:-1]
-            new_stability = empty_stability()
-            new_stability['ruf'] = ruf
-            new_stability['status'] = 'unstable'
-            new_stability['full'] = matched_unstable
-            stability_list.append(new_stability)
-        # Unstable 3: Unstable (wait_timeout_with #27748): unsure if this API is broadly needed or what form it should take\n
-        for matched_unstable in re.findall('Unstable \(\w+ #[0-9]+\)', item):
-            # print('Unstable 3')
-            unstable_part = re.search('\(\w+ #[0-9]+\)', matched_unstable)[0]
-            ruf = unstable_part.split(' ')[0][1:]
-            new_stability = empty_stability()
-            new_stability['ruf'] = ruf
-            new_stability['status'] = 'unstable'
-            new_stability['full'] = matched_unstable
-            stability_list.append(new_stability)
-        # Unstable 4: Unstable (libc): use libc from crates.io\n
-        for matched_unstable in re.findall('Unstable \(\w+\)', item):
-            # print('Unstable 4')
-            unstable_part = re.search('\(\w+\)', matched_unstable)[0]
-            ruf = unstable_part.split(' ')[0][1:-1]
+    for (pattern, ruf_pattern, get_ruf) in UNSTABLE_PATTERNS:
+        for matched_unstable in pattern.findall(item):
             new_stability = empty_stability()
-            new_stability['ruf'] = ruf
+            new_stability['ruf'] = get_ruf(ruf_pattern.search(matched_unstable)[0])
             new_stability['status'] = 'unstable'
             new_stability['full'] = matched_unstable
             stability_list.append(new_stability)
-        # Deprecated
-        for matched_unstable in re.findall('Deprecated since 1.[0-9]+(?:.[0-9]+)*: .+\n', item):
-            since = re.search('1.[0-9]+(?:.[0-9]+)*', matched_unstable)[0]
-            new_stability = empty_stability()
-            new_stability['status'] = 'deprecated'
-            new_stability['since'] = since
-            new_stability['full'] = matched_unstable
-            stability_list.append(new_stability)
+    # Deprecated
+    for matched_unstable in DEPRECATED_PATTERN.findall(item):
+        since = SINCE_PATTERN.search(matched_unstable)[0]
+        new_stability = empty_stability()
+        new_stability['status'] = 'deprecated'
+        new_stability['since'] = since
+        new_stability['full'] = matched_unstable
+        stability_list.append(new_stability)
+    return tuple(stability_list)
+
+
+# Transfer original raw string into well formatted one.
+def analyze_stability(stability: list) -> list:
+    stability_list = list()
+    for item in stability:
+        stability_list += [dict(stability_item) for stability_item in analyze_stability_item(item)]
     if len(stability_list) != len(stability):
         if len(stability) != 1 or 'This is supported on' not in stability[0] == '':
             print('Unhandled Stability', stability)
@@ -283,6 +459,57 @@ def analyze_stability(stability: list) -> list:
     return stability_list
 
 
+# Flags of the stability of an API.
+API_UNSTABLE = 1
+API_DEPRECATED = 2
+API_PORTABILITY = 4 # Only portability items (e.g. `This is supported on Unix only.`), neither unstable nor deprecated.
+PORTABILITY_PATTERN = re.compile('This is supported on|Available on')
+
+
+def get_stability_flags(stability_list: list, raw_stability: list = None) -> int:
+    '''
+    Return API_* flags of stabilities returned by `analyze_stability()`.
+    Portability is only known from `raw_stability`, the items `analyze_stability()` was given.
+    '''
+    flags = 0
+    for stability in stability_list:
+        if stability['status'] == 'unstable':
+            flags |= API_UNSTABLE
+        elif stability['status'] == 'deprecated':
+            flags |= API_DEPRECATED
+    if flags == 0 and raw_stability and any(PORTABILITY_PATTERN.search(item) for item in raw_stability):
+        flags |= API_PORTABILITY
+    return flags
+
+
+def get_stability_rufs(stability_list: list) -> list:
+    '''
+    Return sorted features (RUF) of unstable stabilities returned by `analyze_stability()`.
+    '''
+    return sorted(set(stability['ruf'] for stability in stability_list if stability['status'] == 'unstable' and stability['ruf'] != ''))
+
+
+NORMALIZE_FUNCTIONS = [get_pure_string, get_plain_api, analyze_stability_item]
+
+
+def get_normalize_stats() -> dict:
+    '''
+    Return function name -> [hits, misses] of normalization caches in this process.
+    '''
+    return {function.__name__: [function.cache_info().hits, function.cache_info().misses] for function in NORMALIZE_FUNCTIONS}
+
+
+def add_normalize_stats(stats: dict, other_stats: dict, sign = 1):
+    for (name, counts) in other_stats.items():
+        stats.setdefault(name, [0, 0])
+        stats[name] = [count + sign * other_count for (count, other_count) in zip(stats[name], counts)]
+
+
+def print_normalize_stats(stats: dict):
+    for (name, (hits, misses)) in stats.items():
+        print('Cache', name + ':', hits, 'hits,', misses, 'misses,', format(hits / max(hits + misses, 1), '.2%'), 'hit rate')
+
+
 # Returns (sumodule_path, api_list)
 def recover_info(submodule) -> (str, dict):
     """
@@ -291,6 +518,7 @@ def recover_info(submodule) -> (str, dict):
     We do extra operations to eliminate the redundancy of the results.
     1. Sometimes it includes `\u24d8` which is followed by notable-trait info, useless in our study.
     2. Stability includes portability, deprecate, unstable items. We only latter two.
+    Stability of each API is also summarized in `flags` and `rufs`, so that the analysis does not scan it again.
     """
     plain_submodule = empty_submodule()
     api_list = list()
@@ -311,16 +539,15 @@ def recover_info(submodule) -> (str, dict):
                 api = function['api']
                 # if 'impl' in api:
                     # print('Warning: impl in api', api)
-                api = api.split('\u24d8')[0]
-                api = api.replace('pub ', '') # All analyzed APIs are public, whether marked or not.
-                api = api.replace('default ', '') # `Default` keyword does not affect API.
                 stability = function['stability']
                 api_info = empty_api()
                 api_info['submodule'] = submodule_path
                 api_info['head'] = head
-                api_info['impl'] = get_pure_string(impl_name)
-                api_info['api'] = get_pure_string(api)
+                api_info['impl'] = get_pure_string(strip_notable_traits(impl_name))
+                api_info['api'] = get_plain_api(api)
                 api_info['stability'] = analyze_stability(stability)
+                api_info['flags'] = get_stability_flags(api_info['stability'], stability)
+                api_info['rufs'] = get_stability_rufs(api_info['stability'])
                 api_list.append(api_info)
     plain_submodule['kind'] = submodule['kind']
     plain_submodule['path'] = submodule_path
@@ -359,6 +586,96 @@ def is_same_api(api1: dict, api2: dict) -> bool:
     return False
 
 
+FUNCTION_NAME_PATTERN = re.compile('fn \w+[<|(]')
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def get_function_name(api: str) -> str:
+    '''
+    Return the function name of an api, as compared by `is_same_api()`, or `None` if it is not a function.
+    '''
+    function_name = FUNCTION_NAME_PATTERN.search(api)
+    return function_name[0][3:-1] if function_name else None
+
+
+def match_api_lists(api_list: list, new_api_list: list) -> (int, int):
+    '''
+    Set `next_api_index` of each API in `api_list` to the index of the same API (see `is_same_api()`) in `new_api_list`,
+    or -1 if there is none. Each API in `new_api_list` is the next API of one API at most.
+    APIs are first matched by (impl, api), as in `is_api_same()`, then the rest by (impl, function name).
+    Candidates with the same key are taken in index order.
+    Return counts of APIs matched by (impl, api) and by (impl, function name).
+    '''
+    exact_index = dict() # (impl, api) -> indexes in `new_api_list`
+    name_index = dict() # (impl, function name) -> indexes in `new_api_list`
+    for (idx, new_api) in enumerate(new_api_list):
+        exact_index.setdefault((new_api['impl'], new_api['api']), collections.deque()).append(idx)
+        function_name = get_function_name(new_api['api'])
+        if function_name != None:
+            name_index.setdefault((new_api['impl'], function_name), collections.deque()).append(idx)
+    matched_indexes = set()
+    unmatched_apis = list()
+    for api in api_list:
+        candidates = exact_index.get((api['impl'], api['api']))
+        if candidates:
+            api['next_api_index'] = candidates.popleft()
+            matched_indexes.add(api['next_api_index'])
+        else:
+            api['next_api_index'] = -1
+            unmatched_apis.append(api)
+    exact_count = len(matched_indexes)
+    for api in unmatched_apis:
+        function_name = get_function_name(api['api'])
+        if function_name == None:
+            continue
+        candidates = name_index.get((api['impl'], function_name))
+        while candidates and candidates[0] in matched_indexes:
+            candidates.popleft()
+        if candidates:
+            api['next_api_index'] = candidates.popleft()
+            matched_indexes.add(api['next_api_index'])
+    return (exact_count, len(matched_indexes) - exact_count)
+
+
+def bind_api_versions(docs: list, MIN_VERSION, MAX_VERSION):
+    '''
+    Set `next_api_index` of all APIs in `docs` (versions `MIN_VERSION` to `MAX_VERSION`), see `match_api_lists()`.
+    APIs of submodules removed in the next version, and of the last version, have none.
+    '''
+    for i in range(MIN_VERSION, MAX_VERSION+1):
+        index = i - MIN_VERSION
+        api_count = 0
+        exact_count = 0
+        name_count = 0
+        for (submodule_path, plain_submodule) in docs[index].items():
+            api_list = plain_submodule['plain_apis']
+            api_count += len(api_list)
+            if i == MAX_VERSION or submodule_path not in docs[index+1]:
+                for api in api_list:
+                    api['next_api_index'] = -1
+                continue
+            (submodule_exact_count, submodule_name_count) = match_api_lists(api_list, docs[index+1][submodule_path]['plain_apis'])
+            exact_count += submodule_exact_count
+            name_count += submodule_name_count
+        print('Version', '{:>2}'.format(i), 'API Count', '{:>5}'.format(api_count), 'Same', '{:>5}'.format(exact_count),
+            'Same Function', '{:>5}'.format(name_count), 'Unmatched', '{:>5}'.format(api_count - exact_count - name_count))
+
+
+def bind_all_docs(docs_path = 'all_docs.json'):
+    '''
+    Set `next_api_index` of all APIs in `docs_path` (see `bind_api_versions()`), and write it back.
+    '''
+    docs = load_docs(docs_path)
+    bind_api_versions(docs, 1, len(docs))
+    # Versions are encoded one by one: `json.dump()` with `default` falls back to the (slow) Python encoder.
+    with open(docs_path + '.partial', 'w') as file:
+        file.write('[')
+        for (index, doc) in enumerate(docs):
+            file.write((', ' if index > 0 else '') + json.dumps(doc, default=CompactRecord.to_dict))
+        file.write(']')
+    os.replace(docs_path + '.partial', docs_path)
+
+
 removed_API = []
 new_API = []
 def print_removed_api_info(current_version, api_list: list, new_api_list: list):
@@ -505,34 +822,22 @@ def count_truenew_api(doc:dict, doc_new:dict):
 def get_stability_count(api_list: list):
     unstable_api_count = 0
     for api in api_list:
-        for stability in api['stability']:
-            if stability['status'] == 'unstable':
-                unstable_api_count += 1
-                break
+        if api['flags'] & API_UNSTABLE:
+            unstable_api_count += 1
     return unstable_api_count
 
 
 def is_api_deprecated(api: dict):
-    for stability in api['stability']:
-        if stability['status'] == 'deprecated':
-            return True
-    return False
+    return api['flags'] & API_DEPRECATED != 0
 
 
 def is_api_unstable(api: dict):
-    for stability in api['stability']:
-        if stability['status'] == 'unstable':
-            return True
-    return False
+    return api['flags'] & API_UNSTABLE != 0
 
 
 def is_ruf_same(api:dict, next_api:dict):
-    for stability in api['stability']:
-        if stability['status'] == 'unstable':
-            for next_stability in next_api['stability']:
-                if stability['ruf'] != '' and next_stability['ruf'] != '' and stability['ruf'] == next_stability['ruf']:
-                    return True
-    return False
+    # `rufs` are frozensets in docs from `load_docs()`, which `frozenset()` does not copy.
+    return not frozenset(api['rufs']).isdisjoint(next_api['rufs'])
 
 
 
@@ -904,30 +1209,173 @@ def analyze_single_api_lifetime(lifetime: list):
 
 
 
-def plain_all_docs(MIN_VERSION = 1, MAX_VERSION = 63):
+def rename_crate(data, from_crate: str, to_crate: str):
+    '''
+    Replace crate name `from_crate` (as a whole word) with `to_crate` in all strings of `data`.
+    Re-exported pages are stored as aliases by parse.py (`--dedupe`). Their submodule is the renamed submodule of the page they alias.
+    Compact records (see `load_docs()`) are copied into new records, so the alias never shares records with the page it aliases.
+    '''
+    if isinstance(data, str):
+        return re.sub(r'\b' + re.escape(from_crate) + r'\b', to_crate, data)
+    if isinstance(data, list):
+        return [rename_crate(item, from_crate, to_crate) for item in data]
+    if isinstance(data, tuple):
+        return tuple(rename_crate(item, from_crate, to_crate) for item in data)
+    if isinstance(data, frozenset):
+        return frozenset(rename_crate(item, from_crate, to_crate) for item in data)
+    if isinstance(data, CompactRecord):
+        record = type(data)()
+        for (key, value) in data.items():
+            setattr(record, key, rename_crate(value, from_crate, to_crate))
+        return record
+    if isinstance(data, dict):
+        return {key: rename_crate(value, from_crate, to_crate) for (key, value) in data.items()}
+    return data
+
+
+def resolve_aliases(doc: dict) -> dict:
+    '''
+    Replace alias records (kept by `plain_all_docs(keep_aliases = True)`) in a version of docs with the submodules they alias.
+    '''
+    resolved_doc = dict()
+    for (submodule_path, submodule) in doc.items():
+        if 'alias_of' in submodule:
+            submodule = rename_crate(doc[submodule['alias_of']], submodule['from_crate'], submodule['to_crate'])
+        resolved_doc[submodule_path] = submodule
+    return resolved_doc
+
+
+class JsonSubmoduleReader:
+    '''
+    Read json files of a version (parse.py output without `--output=shard`) the same way as `ShardReader`.
+    '''
+    def __init__(self, json_directory):
+        self.json_directory = json_directory
+
+    def __iter__(self):
+        for file_name in glob(self.json_directory + '/**/*.html.json', recursive=True):
+            with open(file_name, 'r') as file:
+                yield (file_name[len(self.json_directory):-len('.json')], json.load(file))
+
+    def keys(self) -> list:
+        return [file_name[len(self.json_directory):-len('.json')] for file_name in glob(self.json_directory + '/**/*.html.json', recursive=True)]
+
+    def get(self, relative_path):
+        with open(self.json_directory + relative_path + '.json', 'r') as file:
+            return json.load(file)
+
+
+submodule_readers = dict() # (version_directory, pid) -> (shard mtime, reader), see `get_cached_submodule_reader()`
+
+
+def get_submodule_reader(version_directory):
+    '''
+    Return reader of parse.py output of a version: (relative_path, submodule) records, from the version shard if there is one.
+    '''
+    shard_path = get_shard_path(version_directory)
+    if os.path.exists(shard_path):
+        return ShardReader(shard_path)
+    return JsonSubmoduleReader(version_directory + '/json_submodule')
+
+
+def get_cached_submodule_reader(version_directory):
+    '''
+    Return the reader of `get_submodule_reader()`, kept open per process so that batches of a version share its shard index.
+    A shard written again since (e.g. by a later parse) gets a new reader.
+    '''
+    shard_path = get_shard_path(version_directory)
+    shard_mtime = os.path.getmtime(shard_path) if os.path.exists(shard_path) else None
+    key = (version_directory, os.getpid())
+    if key in submodule_readers and submodule_readers[key][0] != shard_mtime:
+        if isinstance(submodule_readers[key][1], ShardReader):
+            submodule_readers[key][1].close()
+        del submodule_readers[key]
+    if key not in submodule_readers:
+        submodule_readers[key] = (shard_mtime, get_submodule_reader(version_directory))
+    return submodule_readers[key][1]
+
+
+# Files a worker of `plain_version_docs()` plains per task.
+PLAIN_BATCH_SIZE = 64
+normalize_stats = dict() # -> [hits, misses] of normalization caches of all plained versions, see `get_normalize_stats()`
+
+
+def plain_submodule(submodule_reader, submodule_original, keep_aliases = False) -> (str, dict):
+    '''
+    Return (submodule_path, plain submodule) of a submodule read by `submodule_reader`, see `plain_all_docs()`.
+    '''
+    if 'alias_of' in submodule_original:
+        alias = submodule_original
+        aliased_submodule = submodule_reader.get(alias['alias_of'])
+        submodule_original = rename_crate(aliased_submodule, alias['from_crate'], alias['to_crate'])
+        if keep_aliases:
+            return (get_pure_string(submodule_original['path']), {
+                'alias_of': get_pure_string(aliased_submodule['path']),
+                'from_crate': alias['from_crate'],
+                'to_crate': alias['to_crate'],
+            })
+    return recover_info(submodule_original)
+
+
+def plain_submodule_batch(batch) -> (list, dict):
+    '''
+    Return [(submodule_path, plain submodule)] of a batch `(version_directory, relative_paths, keep_aliases)`, in batch order,
+    and normalization cache stats of the batch (see `get_normalize_stats()`).
+    Run by worker processes of `plain_version_docs()`, each with its own reader per version (see `get_cached_submodule_reader()`).
+    '''
+    (version_directory, relative_paths, keep_aliases) = batch
+    stats = get_normalize_stats()
+    submodule_reader = get_cached_submodule_reader(version_directory)
+    plain_batch = [plain_submodule(submodule_reader, submodule_reader.get(relative_path), keep_aliases) for relative_path in relative_paths]
+    batch_stats = get_normalize_stats()
+    add_normalize_stats(batch_stats, stats, -1)
+    return (plain_batch, batch_stats)
+
+
+def plain_version_docs(i, keep_aliases = False, pool = None) -> dict:
+    '''
+    Return submodule path -> plain submodule of version `1.i.0`, see `plain_all_docs()`.
+    Submodules are plained in order of their relative paths, so that a submodule path found in two files always keeps the
+    same one. With a `pool` (`multiprocessing.Pool`), batches of `PLAIN_BATCH_SIZE` files are plained by its workers,
+    and merged in the same order. Normalization cache stats of all workers are added to `normalize_stats`.
+    '''
+    version_num = '1.' + str(i) + '.0'
+    current_directory = os.getcwd() + '/'
+    version_directory = current_directory + version_num + '/rust-docs-nightly-x86_64-unknown-linux-gnu'
+    submodule_reader = get_submodule_reader(version_directory)
+    relative_paths = sorted(submodule_reader.keys())
+    batches = [(version_directory, relative_paths[start:start+PLAIN_BATCH_SIZE], keep_aliases) for start in range(0, len(relative_paths), PLAIN_BATCH_SIZE)]
+    submodule_map = {} # Map submodule path to submodule
+    for (plain_batch, batch_stats) in (pool.imap(plain_submodule_batch, batches) if pool != None else map(plain_submodule_batch, batches)):
+        add_normalize_stats(normalize_stats, batch_stats)
+        for (submodule_path, submodule_plain) in plain_batch:
+            submodule_map[submodule_path] = submodule_plain
+    return submodule_map
+
+
+def plain_all_docs(MIN_VERSION = 1, MAX_VERSION = 63, keep_aliases = False, workers = 1):
     '''
     Parse all rustdocs to get items data in different compiler versions.
     These data are actually Abstract Resource Tree. Through analysing AST, we can know API evolution, especially unstable API.
     @Algorithm:
     1. We first parse root doc and call `get_crates()` to get all standard library crates, which we will then parse them.
     2. We call `parse_html()` to parse all html files, which contain AST of all data (e.g. modules, primitives, functions, structs).
-
+    Submodules are read from the version shard if parse.py wrote one (`--output=shard`), otherwise from json files.
+    Re-exported pages may be stored as aliases (`{'alias_of', 'from_crate', 'to_crate'}`, see parse.py `--dedupe`).
+    By default they are expanded into full submodules. Set `keep_aliases` to keep them as aliases of submodule paths,
+    and call `resolve_aliases()` to expand them later.
+    Submodules are plained by `workers` processes. The output does not depend on the number of workers.
     '''
     print('Start Analyzing Rust Docs ...')
     docs = list() # Each version of docs
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
     for i in range(MIN_VERSION, MAX_VERSION+1):
-        version_num = '1.' + str(i) + '.0'
-        print('Parsing Rust Docs', version_num)
-        # Find root html: std/index.html
-        current_directory = os.getcwd() + '/'
-        doc_directory = current_directory + version_num + '/rust-docs-nightly-x86_64-unknown-linux-gnu/json_submodule'
-        submodule_map = {} # Map submodule path to submodule
-        for file_name in glob(doc_directory + '/**/*.html.json', recursive=True):
-            with open(file_name, 'r') as file:
-                submodule_original = json.load(file)
-            (submodule_path, submodule_plain) = recover_info(submodule_original)
-            submodule_map[submodule_path] = submodule_plain
-        docs.append(submodule_map)
+        print('Parsing Rust Docs', '1.' + str(i) + '.0')
+        docs.append(plain_version_docs(i, keep_aliases, pool))
+    if pool != None:
+        pool.close()
+        pool.join()
+    print_normalize_stats(normalize_stats)
     with open('all_docs.json', 'w') as file:
         json.dump(docs, file)
     # for doc in docs:
@@ -937,26 +1385,38 @@ def plain_all_docs(MIN_VERSION = 1, MAX_VERSION = 63):
     #         print('------------------')
 
 
+def get_workers() -> int:
+    '''
+    Read `--workers=N` from command line.
+    '''
+    for arg in sys.argv[2:]:
+        if arg.startswith('--workers='):
+            return int(arg.split('=', 1)[1])
+    return 1
+
+
 
 
 
 #TODO: Anylize the API evolution in different ways, aspects. (API change, Stability change, etc)
-if sys.argv[1] == 'plain_apis':
-    plain_all_docs()
-if sys.argv[1] == 'plain_apis_selected':
-    plain_all_docs(int(sys.argv[2]), int(sys.argv[3]))
-if sys.argv[1] == 'complete':
-    with open('all_docs.json', 'r') as file:
-        docs = json.load(file)
-    analyze_api_evolution(docs, 1, 63)
-if sys.argv[1] == 'complete_selected':
-    with open('all_docs.json', 'r') as file:
-        docs = json.load(file)
-    min = int(sys.argv[2])
-    max = int(sys.argv[3])
-    analyze_api_evolution(docs[min-1:max], min, max)
-if sys.argv[1] == 'results':
-    make_graphs()
+if __name__ == '__main__':
+    if sys.argv[1] == 'plain_apis':
+        plain_all_docs(keep_aliases = '--keep_aliases' in sys.argv, workers = get_workers())
+    if sys.argv[1] == 'plain_apis_selected':
+        plain_all_docs(int(sys.argv[2]), int(sys.argv[3]), '--keep_aliases' in sys.argv, get_workers())
+    if sys.argv[1] == 'bind_apis':
+        # Set `next_api_index` of `all_docs.json` before `complete`.
+        bind_all_docs()
+    if sys.argv[1] == 'complete':
+        docs = load_docs()
+        analyze_api_evolution(docs, 1, 63)
+    if sys.argv[1] == 'complete_selected':
+        docs = load_docs()
+        min = int(sys.argv[2])
+        max = int(sys.argv[3])
+        analyze_api_evolution(docs[min-1:max], min, max)
+    if sys.argv[1] == 'results':
+        make_graphs()
 
 # with open('test_serial.json', 'r') as file:
 #     submodule = json.load(file)
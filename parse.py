@@ -3,9 +3,25 @@ import re
 import tarfile
 from datetime import datetime,timedelta
 import os
-import gzip
+import shutil
 import urllib.request
+import urllib.error
+import http.client
+import http.server
 import json
+import sys
+import time
+import threading
+import tempfile
+import io
+import multiprocessing
+import hashlib
+import inspect
+import sqlite3
+import signal
+import resource
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from shard import ShardReader, ShardWriter, get_shard_path, remove_shard, move_shard, truncate_shard
 
 
 # Cannot print unicode corretly. Be sure that you know this.
@@ -13,73 +29,664 @@ def print_pretty(dict_item):
     print(json.dumps(dict_item, indent = 4, sort_keys=True))
 
 
-def download_file(version_date, out_file, is_retry = False):
-    url = 'https://static.rust-lang.org/dist/' + version_date + '/rust-docs-nightly-x86_64-unknown-linux-gnu.tar.gz'
-    # Download archive
+# Step 1: Download rustdoc of every release. Archives are published on the dist server by release date.
+RELEASES_URL = 'https://raw.githubusercontent.com/rust-lang/rust/master/RELEASES.md'
+DIST_URL = 'https://static.rust-lang.org/dist/'
+DOC_ARCHIVE_NAME = 'rust-docs-nightly-x86_64-unknown-linux-gnu.tar.gz'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_ATTEMPTS = 5 # Tries in a row without progress before a download fails.
+DOWNLOAD_TIMEOUT = 60
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class ChecksumMismatch(Exception):
+    '''
+    A download does not match its published checksum. The archive of that date exists, so other dates are not tried.
+    '''
+
+
+def get_archive_url(version_date, dist_url = DIST_URL):
+    return dist_url + version_date + '/' + DOC_ARCHIVE_NAME
+
+
+def get_published_sha256(url, timeout = DOWNLOAD_TIMEOUT) -> str:
+    '''
+    Return the checksum the dist server publishes next to an archive (`<url>.sha256`), or `None` if there is none.
+    '''
     try:
-        # Read the file inside the .gz archive located at url
-        with urllib.request.urlopen(url) as response:
-            with gzip.GzipFile(fileobj=response) as uncompressed:
-                file_content = uncompressed.read()
+        with urllib.request.urlopen(url + '.sha256', timeout=timeout) as response:
+            return response.read().decode('utf-8').split()[0].lower()
+    except urllib.error.HTTPError:
+        return None
+
+
+def get_file_sha256(file_name) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
 
-        # write to file in binary mode 'wb'
-        with open(out_file, 'wb') as f:
-            f.write(file_content)
-            return 0
+
+def download_ranged(url, partial_file, attempts = DOWNLOAD_ATTEMPTS, timeout = DOWNLOAD_TIMEOUT):
+    '''
+    Download `url` into `partial_file` chunk by chunk. If `partial_file` exists, the download continues from its end with a `Range` request.
+    A dropped connection is resumed the same way, until `attempts` tries in a row make no progress.
+    If the server ignores the range, or answers another one than asked, the download starts again from the beginning:
+    only bytes added to a resumed download are progress, so a server which always restarts fails after `attempts` drops.
+    A response without a known length is complete when it ends without error (`download_file()` checks the checksum).
+    '''
+    failures = 0
+    while True:
+        offset = os.path.getsize(partial_file) if os.path.exists(partial_file) else 0
+        request = urllib.request.Request(url, headers={'Range': 'bytes=' + str(offset) + '-'} if offset > 0 else {})
+        total_size = None
+        resumed = False
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                content_length = response.headers.get('Content-Length')
+                if response.status == 206:
+                    content_range = CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+                    if content_range == None or int(content_range.group(1)) != offset:
+                        os.remove(partial_file)
+                        raise http.client.HTTPException('Unexpected Content-Range ' + str(response.headers.get('Content-Range')) + ' at ' + str(offset) + ', restarting')
+                    resumed = True
+                    if content_range.group(3) != '*':
+                        total_size = int(content_range.group(3))
+                else:
+                    offset = 0
+                if content_length != None:
+                    total_size = offset + int(content_length)
+                with open(partial_file, 'ab' if offset > 0 else 'wb') as file:
+                    shutil.copyfileobj(response, file, DOWNLOAD_CHUNK_SIZE)
+                if total_size == None:
+                    return # Ended without error, and no length to check it against.
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset > 0:
+                return # Nothing left after `offset`: the last run stopped before renaming it.
+            raise
+        except (OSError, http.client.HTTPException) as e:
+            print_progress('Download interrupted at', os.path.getsize(partial_file) if os.path.exists(partial_file) else 0, 'bytes:', e, url)
+        size = os.path.getsize(partial_file) if os.path.exists(partial_file) else 0
+        if total_size != None and size == total_size:
+            return
+        failures = 0 if resumed and size > offset else failures + 1
+        if failures >= attempts:
+            raise Exception('Download failed after ' + str(attempts) + ' attempts without progress: ' + url)
+
+
+def download_file(version_date, out_file, is_retry = False, dist_url = DIST_URL):
+    url = get_archive_url(version_date, dist_url)
+    # Download archive
+    try:
+        # Copy the .gz archive located at url chunk by chunk. The archive is kept compressed, `tarfile` can open it directly.
+        # Write to a `.partial` file, which is resumed by the next try. Rename it when complete and verified, so an interrupted
+        # or corrupted download is never taken as existing.
+        expected_sha256 = get_published_sha256(url)
+        download_ranged(url, out_file + '.partial')
+        if expected_sha256 != None and get_file_sha256(out_file + '.partial') != expected_sha256:
+            os.remove(out_file + '.partial')
+            print_progress('Checksum mismatch, removed the download of', url)
+            raise ChecksumMismatch('Checksum mismatch')
+        os.replace(out_file + '.partial', out_file)
+        return 0
+    except ChecksumMismatch as e:
+        print(e, url)
+        return 1
     # Retry +- 1 day: Sometimes the release day is not the same as the release file url, but within one day.
     except Exception as e:
         if is_retry == False:
             date_object = datetime.strptime(version_date, '%Y-%m-%d')
-            if download_file((date_object+timedelta(days=1)).strftime('%Y-%m-%d'), out_file, True) == 0 \
-                or download_file((date_object+timedelta(days=-1)).strftime('%Y-%m-%d'), out_file, True) == 0:
+            if download_file((date_object+timedelta(days=1)).strftime('%Y-%m-%d'), out_file, True, dist_url) == 0 \
+                or download_file((date_object+timedelta(days=-1)).strftime('%Y-%m-%d'), out_file, True, dist_url) == 0:
                     return 0
             else:
                 print(e, url)
         return 1
 
 
-def extract_file(fname, to_directory='.'):
-    if fname.endswith("tar.gz"):
-        tar = tarfile.open(fname)
-        tar.extractall(to_directory)
-        tar.close()
+def probe_archive(version_date, dist_url = DIST_URL, timeout = 30) -> int:
+    '''
+    Check if the archive of `version_date` exists with a `HEAD` request. Nothing is downloaded.
+    @Return archive size in bytes (0 if the server does not tell), or -1 if it does not exist.
+    '''
+    request = urllib.request.Request(get_archive_url(version_date, dist_url), method='HEAD')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return int(response.headers.get('Content-Length', 0))
+    except Exception:
+        return -1
+
 
+def probe_release_date(version_date, dist_url = DIST_URL):
+    '''
+    The release day may not be the same as the release file url, but within one day.
+    Probe the release day, +1 day and -1 day (same order as the retries in `download_file()`).
+    @Return (date, size) of the first existing archive, or (None, -1) if none exists.
+    '''
+    date_object = datetime.strptime(version_date, '%Y-%m-%d')
+    for delta in [0, 1, -1]:
+        candidate_date = (date_object+timedelta(days=delta)).strftime('%Y-%m-%d')
+        size = probe_archive(candidate_date, dist_url)
+        if size >= 0:
+            return (candidate_date, size)
+    return (None, -1)
 
-def crawl_rustdoc():
-    r = requests.get('https://raw.githubusercontent.com/rust-lang/rust/master/RELEASES.md')
+
+def get_release_versions(releases_url = RELEASES_URL) -> list:
+    '''
+    Read release notes to get all versions and their release dates.
+    @Return list of (version_num, version_date), from the oldest to the newest. v1.0.0 has no doc, we skip it.
+    '''
+    r = requests.get(releases_url)
     text = r.text
     versions = re.findall("Version 1\.[0-9]+\.0 \([0-9]+-[0-9]+-[0-9]+\)", text)
-    # `version` example: "Version 0.1  (2012-01-20)"
-    print("Starting downloading rustdoc from " + versions[-2] + " to " + versions[0])
+    # `version` example: "Version 1.1.0 (2015-06-25)"
+    release_versions = list()
     for version in reversed(versions):
         version_list = version.split(' ')
         version_num = version_list[1]
         version_date = version_list[2].strip('(').strip(')')
-        # v1.0.0 has no doc
         if version_num == '1.0.0':
             continue
-        file_name = version_num + ".tar.gz"
-        directory_name = version_num
-        if os.path.exists(file_name):
-            print("Version", version_num, "exists, skip...")
-        else:
-            print("Downloading v" + version_num + " ......")
-            download_file(version_date, file_name)
+        release_versions.append((version_num, version_date))
+    return release_versions
+
+
+print_lock = threading.Lock()
+def print_progress(*args):
+    # Download workers print concurrently. Keep lines from being interleaved.
+    with print_lock:
+        print(*args, flush=True)
+
+
+def extract_file(fname, to_directory='.'):
+    if fname.endswith("tar.gz"):
+        tar = tarfile.open(fname)
+        tar.extractall(to_directory)
+        tar.close()
+
+
+def stream_extract(version_date, to_directory, dist_url = DIST_URL) -> int:
+    '''
+    Streaming mode of `download_file()` + `extract_file()`.
+    The http response is piped through gzip into `tarfile` in stream mode, and members are written one by one.
+    Memory is bounded by the stream buffers instead of the archive size, and no intermediate archive is stored.
+    Members are extracted into `<to_directory>.partial`, which is renamed when the whole archive is extracted,
+    so that an interrupted extraction will never be taken as complete.
+    @Return 0 if success, 1 if failed.
+    '''
+    url = get_archive_url(version_date, dist_url)
+    partial_directory = to_directory + '.partial'
+    if os.path.exists(partial_directory):
+        shutil.rmtree(partial_directory)
+    try:
+        with urllib.request.urlopen(url) as response:
+            with tarfile.open(fileobj=response, mode='r|gz') as tar:
+                for member in tar:
+                    tar.extract(member, partial_directory)
+        os.rename(partial_directory, to_directory)
+        return 0
+    except Exception as e:
+        print(e, url)
+        return 1
+
+
+def fetch_version(version_num, version_date, dist_url = DIST_URL, stream = False) -> str:
+    '''
+    Download and extract the rustdoc of one version. This is the work unit of `crawl_rustdoc()`.
+    The release date is probed before downloading, so that wrong dates cost one `HEAD` request rather than a failed download.
+    If `stream` is set, the archive is extracted while downloading and is not stored (see `stream_extract()`).
+    @Return status: 'exists', 'done' or 'failed'.
+    '''
+    directory_name = version_num
+    if stream:
         if os.path.exists(directory_name):
-            print("Directory", version_num, "exists, skip...")
-        else:
-            print("Extracting v" + version_num + " ......")
-            extract_file(file_name, directory_name)
+            print_progress("Directory", version_num, "exists, skip...")
+            return 'exists'
+        (archive_date, size) = probe_release_date(version_date, dist_url)
+        if archive_date == None:
+            print_progress("Version", version_num, "not found around", version_date)
+            return 'failed'
+        print_progress("Streaming v" + version_num, "(" + archive_date + ",", format(size / 1024 / 1024, '.1f'), "MB) ......")
+        start_time = time.time()
+        if stream_extract(archive_date, directory_name, dist_url) != 0:
+            return 'failed'
+        print_progress("Extracted v" + version_num, "in", format(time.time() - start_time, '.1f'), "s")
+        return 'done'
+    status = download_version(version_num, version_date, dist_url)
+    if status == 'failed':
+        return status
+    if extract_version(version_num) == 'done':
+        status = 'done'
+    return status
+
+
+def download_version(version_num, version_date, dist_url = DIST_URL) -> str:
+    '''
+    Download the rustdoc archive of one version (`<version>.tar.gz`), see `fetch_version()`.
+    @Return status: 'exists', 'done' or 'failed'.
+    '''
+    file_name = version_num + ".tar.gz"
+    if os.path.exists(file_name):
+        print_progress("Version", version_num, "exists, skip...")
+        return 'exists'
+    (archive_date, size) = probe_release_date(version_date, dist_url)
+    if archive_date == None:
+        print_progress("Version", version_num, "not found around", version_date)
+        return 'failed'
+    print_progress("Downloading v" + version_num, "(" + archive_date + ",", format(size / 1024 / 1024, '.1f'), "MB) ......")
+    start_time = time.time()
+    if download_file(archive_date, file_name, True, dist_url) != 0:
+        return 'failed'
+    print_progress("Downloaded v" + version_num, "in", format(time.time() - start_time, '.1f'), "s")
+    return 'done'
+
+
+def extract_version(version_num) -> str:
+    '''
+    Extract the downloaded rustdoc archive of one version into `<version>/`, see `fetch_version()`.
+    @Return status: 'exists' or 'done'.
+    '''
+    file_name = version_num + ".tar.gz"
+    directory_name = version_num
+    if os.path.exists(directory_name):
+        print_progress("Directory", version_num, "exists, skip...")
+        return 'exists'
+    print_progress("Extracting v" + version_num + " ......")
+    extract_file(file_name, directory_name)
+    return 'done'
+
+
+def crawl_rustdoc(workers = 8, dist_url = DIST_URL, releases_url = RELEASES_URL, stream = False):
+    '''
+    Download and extract rustdoc of all versions. Versions are fetched concurrently by at most `workers` threads,
+    as most of the time is spent waiting for the network.
+    If `stream` is set, archives are extracted while downloading and no `.tar.gz` file is kept.
+    '''
+    release_versions = get_release_versions(releases_url)
+    print("Starting downloading rustdoc from", release_versions[0][0], "to", release_versions[-1][0], "with", workers, "workers")
+    results = dict()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = dict()
+        for (version_num, version_date) in release_versions:
+            futures[executor.submit(fetch_version, version_num, version_date, dist_url, stream)] = version_num
+        for future in as_completed(futures):
+            version_num = futures[future]
+            try:
+                results[version_num] = future.result()
+            except Exception as e:
+                print_progress("Version", version_num, "failed:", e)
+                results[version_num] = 'failed'
+            print_progress("[" + str(len(results)) + "/" + str(len(futures)) + "]", "v" + version_num, results[version_num])
+    failed = [version_num for (version_num, _) in release_versions if results[version_num] == 'failed']
+    if len(failed) != 0:
+        print("Failed versions:", failed)
+    return results
+
+
+class LocalDistHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Stand-in for the dist server in download tests. The server has `files` (url path -> bytes), `faults` (one fault is
+    taken by each `GET`) and `requests` (log of (method, path, range)). Faults are:
+    'drop': send half of the body and close the connection. 'drop_head': close it after the headers.
+    'ignore_range': answer 200 with the whole file. 'wrong_range': answer 206 from byte 0 whatever the range.
+    'no_length': answer 200 without Content-Length, ended by closing the connection.
+    Faults can be combined with '+', e.g. 'ignore_range+drop'.
+    With a `delay`, each `GET` waits before sending its body, and `max_active` tells how many waited at the same time.
+    '''
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.server.requests.append(('HEAD', self.path, None))
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.files[self.path])))
+        self.end_headers()
+
+    def do_GET(self):
+        requested_range = self.headers.get('Range')
+        self.server.requests.append(('GET', self.path, requested_range))
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        content = self.server.files[self.path]
+        faults = self.server.faults.pop(0).split('+') if len(self.server.faults) != 0 else list()
+        if 'ignore_range' in faults:
+            requested_range = None
+        start = int(requested_range[len('bytes='):-1]) if requested_range != None else 0
+        if 'wrong_range' in faults:
+            start = 0
+        if start >= len(content) and start > 0:
+            self.send_error(416)
+            return
+        body = content[start:]
+        self.send_response(206 if requested_range != None else 200)
+        if self.server.delay:
+            with self.server.lock:
+                self.server.active += 1
+                self.server.max_active = max(self.server.max_active, self.server.active)
+            time.sleep(self.server.delay)
+            with self.server.lock:
+                self.server.active -= 1
+        if 'no_length' not in faults:
+            self.send_header('Content-Length', str(len(body)))
+        if requested_range != None:
+            self.send_header('Content-Range', 'bytes ' + str(start) + '-' + str(len(content) - 1) + '/' + str(len(content)))
+        self.end_headers()
+        if 'drop' in faults:
+            body = body[:len(body) // 2]
+        elif 'drop_head' in faults:
+            body = b''
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            pass # The client closed the connection, e.g. after an unexpected range.
+        self.close_connection = True
+
+
+def start_local_dist_server(files, faults = None, delay = 0):
+    '''
+    Serve `files` with `LocalDistHandler` on a local port, in a thread. Stop it with `server.shutdown()`.
+    @Return (server, base url)
+    '''
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), LocalDistHandler)
+    server.files = files
+    server.faults = list(faults) if faults != None else list()
+    server.requests = list()
+    server.delay = delay
+    server.lock = threading.Lock()
+    server.active = 0
+    server.max_active = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return (server, 'http://127.0.0.1:' + str(server.server_address[1]) + '/')
+
+
+def test_download_resume():
+    '''
+    Check `download_ranged()` and `download_file()` against a local server which drops connections and mishandles ranges.
+    Each case is (faults, whether the download succeeds). Failing downloads must stop after `DOWNLOAD_ATTEMPTS` tries.
+    '''
+    content = os.urandom(3 * DOWNLOAD_CHUNK_SIZE + 12345)
+    path = '/2021-01-01/' + DOC_ARCHIVE_NAME
+    cases = [
+        ([], True),
+        (['drop', 'drop', 'drop'], True),
+        (['drop', 'ignore_range'], True),
+        (['drop', 'wrong_range'], True),
+        (['no_length'], True),
+        (['drop', 'ignore_range+no_length'], True),
+        (['drop_head'] * DOWNLOAD_ATTEMPTS, False),
+        (['drop'] + ['ignore_range+drop'] * DOWNLOAD_ATTEMPTS, False),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        for (faults, succeeds) in cases:
+            (server, dist_url) = start_local_dist_server({path: content}, faults)
+            partial_file = directory + '/download.partial'
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            try:
+                download_ranged(get_archive_url('2021-01-01', dist_url), partial_file, timeout=5)
+                succeeded = True
+            except Exception:
+                succeeded = False
+            server.shutdown()
+            assert succeeded == succeeds, faults
+            if succeeded:
+                with open(partial_file, 'rb') as file:
+                    assert file.read() == content, faults
+            print('Download with faults', faults, 'ok after', len(server.requests), 'requests')
+        # A checksum mismatch removes the download, and does not try other dates.
+        files = {path: content, path + '.sha256': b'0' * 64 + b'  ' + DOC_ARCHIVE_NAME.encode(),
+            '/2021-01-02/' + DOC_ARCHIVE_NAME: content}
+        (server, dist_url) = start_local_dist_server(files)
+        out_file = directory + '/download.tar.gz'
+        assert download_file('2021-01-01', out_file, False, dist_url) == 1
+        server.shutdown()
+        assert not os.path.exists(out_file) and not os.path.exists(out_file + '.partial')
+        assert all(request[1].startswith('/2021-01-01/') for request in server.requests), server.requests
+        print('Checksum mismatch ok after', len(server.requests), 'requests')
+
+
+def test_crawl_rustdoc(workers = 4):
+    '''
+    Check `crawl_rustdoc()` against a local stand-in of the dist server, in both download and stream modes:
+    archives published on the release date, the day after, the day before and not at all, fetched by concurrent workers.
+    '''
+    releases = [('1.1.0', '2015-06-25', 0), ('1.2.0', '2015-08-07', 1), ('1.3.0', '2015-09-17', -1), ('1.4.0', '2015-10-29', None)]
+    releases_text = '\n'.join('Version ' + version_num + ' (' + version_date + ')\n==========================\n'
+        for (version_num, version_date, _) in reversed(releases + [('1.0.0', '2015-05-15', None)]))
+    files = {'/RELEASES.md': releases_text.encode('utf-8')}
+    for (version_num, version_date, delta) in releases:
+        if delta == None:
+            continue
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            content = ('<html>' + version_num + '</html>').encode('utf-8')
+            info = tarfile.TarInfo(DOC_PACKAGE + '/' + DOC_HTML_ROOT + '/index.html')
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        archive_date = (datetime.strptime(version_date, '%Y-%m-%d') + timedelta(days=delta)).strftime('%Y-%m-%d')
+        files['/' + archive_date + '/' + DOC_ARCHIVE_NAME] = archive.getvalue()
+    expected = {'1.1.0': 'done', '1.2.0': 'done', '1.3.0': 'done', '1.4.0': 'failed'}
+    current_directory = os.getcwd()
+    for stream in [False, True]:
+        (server, dist_url) = start_local_dist_server(files, delay=0.5)
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                results = crawl_rustdoc(workers, dist_url, dist_url + 'RELEASES.md', stream)
+                for (version_num, status) in expected.items():
+                    if status != 'done':
+                        continue
+                    with open(version_num + '/' + DOC_PACKAGE + '/' + DOC_HTML_ROOT + '/index.html', 'r') as file:
+                        assert version_num in file.read(), version_num
+                    assert os.path.exists(version_num + '.tar.gz') != stream, version_num
+            finally:
+                os.chdir(current_directory)
+        server.shutdown()
+        assert results == expected, results
+        # Dates are probed in the order of `probe_release_date()`, and only the archive found is downloaded.
+        probed = [path.split('/')[1] for (method, path, _) in server.requests if method == 'HEAD' and path.startswith('/2015-08-')]
+        assert probed == ['2015-08-07', '2015-08-08'], probed
+        probed = [path.split('/')[1] for (method, path, _) in server.requests if method == 'HEAD' and path.startswith('/2015-09-')]
+        assert probed == ['2015-09-17', '2015-09-18', '2015-09-16'], probed
+        downloaded = sorted(path.split('/')[1] for (method, path, _) in server.requests if method == 'GET' and path.endswith(DOC_ARCHIVE_NAME))
+        assert downloaded == ['2015-06-25', '2015-08-08', '2015-09-16'], downloaded
+        assert server.max_active > 1, 'Archives were not downloaded concurrently'
+        print('Crawl', 'stream' if stream else 'download', 'ok,', server.max_active, 'downloads at once')
 
 
 # Step 2: Analyse html files. We extract RUF for every items. The items are under each html files.
 # In this way, we only need to extract all html files and analyse them based on title, content, and others.
 from glob import glob
-from bs4 import BeautifulSoup, NavigableString
-from selenium import webdriver
-from selenium.webdriver.firefox.service import Service
-from webdriver_manager.firefox import GeckoDriverManager
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer
+from bs4.builder import HTMLTreeBuilder
 import html
+from html.parser import HTMLParser
+
+
+# Tree builders of bs4 we support. `lxml` is much faster than the pure python `html.parser`.
+# Check that they extract the same APIs with `test_parser_backends()` before switching.
+PARSER_BACKENDS = ['html.parser', 'lxml']
+
+
+def default_parse_options():
+    return {
+        'parser': 'html.parser', # -> PARSER_BACKENDS
+        'read_bytes': False, # Read html as bytes and let the parser decode it, rather than decoding to `str` first.
+        'scoped': False, # Only build the main content section without docblock bodies, see `ScopedSoup`.
+        'extractor': 'soup', # 'soup' or 'stream' (single pass over parser events, see `StreamExtractor`).
+        'classify': True, # Skip pages `classify_html()` knows `parse_html()` returns `None` for, without reading them.
+        'cache': None, # Path of the parse cache (sqlite) shared by all versions, see `get_cache_key()`. `None` disables it.
+        'dedupe': False, # Parse re-exported pages (e.g. `std::vec::Vec` of `alloc::vec::Vec`) once, see `dedupe_units()`.
+        'timeout': PARSE_TIMEOUT, # Time budget of a page in seconds, see `parse_with_budget()`. `None` disables it.
+        'memory': PARSE_MEMORY, # Memory budget of a page in bytes, see `set_memory_budget()`. `None` disables it.
+        'quarantine': QUARANTINE_FILE, # Pages over the budget are listed here, see `reparse_quarantined()`.
+        'inventory': False, # Only parse pages in the inventory of the version, see `build_inventory()`.
+    }
+
+
+# Everything we extract is in the main content section: `section#main` before 1.58.0, `section#main-content` since.
+MAIN_SECTION_IDS = ['main', 'main-content']
+
+
+def is_skipped_docblock(attrs) -> bool:
+    '''
+    Docblocks contain documentation (text, examples, headings), which we don't extract.
+    Docblocks containing the item declaration (`item-decl`, `type-decl`) are not skipped.
+    '''
+    classes = attrs.get('class', '')
+    if isinstance(classes, list):
+        classes = ' '.join(classes)
+    classes = classes.split()
+    return 'docblock' in classes and not any(item_class.endswith('-decl') for item_class in classes)
+
+
+class ScopedSoup(BeautifulSoup):
+    '''
+    Soup which only builds the subtree we extract from, to save time and memory on big pages.
+    1. Only the main content section is built (with `parse_only`). Sidebar, search and settings are dropped.
+    2. Docblock bodies are dropped while parsing. The docblock `div` itself is kept (empty), so their siblings are not changed.
+    Tags inside a docblock are never pushed, so we only count `div` depth to find the end of the docblock.
+    '''
+    def __init__(self, *args, **kwargs):
+        self.docblock_depth = 0
+        super().__init__(*args, **kwargs)
+
+    def handle_starttag(self, name, namespace, nsprefix, attrs, *args, **kwargs):
+        if self.docblock_depth > 0:
+            if name == 'div':
+                self.docblock_depth += 1
+            return None
+        tag = super().handle_starttag(name, namespace, nsprefix, attrs, *args, **kwargs)
+        if tag != None and name == 'div' and is_skipped_docblock(attrs):
+            self.docblock_depth = 1
+        return tag
+
+    def handle_endtag(self, name, nsprefix = None):
+        if self.docblock_depth > 0:
+            if name != 'div':
+                return
+            self.docblock_depth -= 1
+            if self.docblock_depth > 0:
+                return
+        super().handle_endtag(name, nsprefix)
+
+    def handle_data(self, data):
+        if self.docblock_depth > 0:
+            return
+        super().handle_data(data)
+
+
+def make_soup(html_content, parser = 'html.parser', scoped = False):
+    '''
+    Build soup with the selected parser backend. `html_content` can be `str` or utf-8 `bytes`.
+    If `scoped` is set, only the main content section is built without docblock bodies (see `ScopedSoup`).
+    '''
+    assert parser in PARSER_BACKENDS, 'Unknown parser backend ' + parser
+    soup_class = BeautifulSoup
+    kwargs = dict()
+    if scoped:
+        soup_class = ScopedSoup
+        kwargs['parse_only'] = SoupStrainer('section', id=MAIN_SECTION_IDS)
+    if isinstance(html_content, bytes):
+        kwargs['from_encoding'] = 'utf-8'
+    return soup_class(html_content, parser, **kwargs)
+
+
+# The layout of rustdoc changes with versions, and so does our parsing (see `LAYOUT_FEATURES` below).
+# Versions in the same era are parsed in exactly the same way. Each era is (first version, name).
+LAYOUT_ERAS = [
+    (1, '<=20'),
+    (21, '21-37'), # Implementations may be collapsed into `div`
+    (38, '38-48'), # Data fields are organized in `div`
+    (49, '49-51'), # Stability items are `item-info`
+    (52, '52'), # Impls are in `details`
+    (53, '53'),
+    (54, '54-57'),
+    (58, '58-60'), # Header is `div.main-heading`
+    (61, '>=61'), # `item-info` is `span`
+]
+
+
+def get_layout_era(version_num) -> str:
+    era_name = LAYOUT_ERAS[0][1]
+    for (first_version, name) in LAYOUT_ERAS:
+        if version_num >= first_version:
+            era_name = name
+    return era_name
+
+
+# Layout features parsing functions check instead of version numbers: feature -> (first version, last version or `None`).
+# A layout plan is the features of an era, so plans are computed once per era and shared by its versions.
+LAYOUT_FEATURES = {
+    'stability_div': (1, 48), # Stability items are `div.stability`
+    'h3h4_indiv': (21, None), # Implementations may be collapsed into `div`
+    'fields_indiv': (38, None), # Data fields are organized in `div`
+    'item_info': (49, None), # Stability items are `item-info`
+    'details': (52, None), # Impls are in `details`
+    'details_h4': (52, 52), # Functions are `h4` in `details`, and trait methods are in `div.methods`
+    'details_div': (53, 53), # Functions may be `div` in `details`
+    'main_heading': (58, None), # Header is `div.main-heading`
+    'item_info_span': (61, None), # `item-info` is `span`
+}
+# Newest version we have checked parsing against. Pages of newer versions are matched to a known plan by their markup.
+LAST_KNOWN_VERSION = 63
+# Markup that tells a layout apart: marker -> (pattern, features a plan must have if the pattern is found).
+# Only markup found on the page counts, as a page may lack any of them (e.g. no stability items).
+LAYOUT_MARKERS = {
+    'stability_div': (re.compile(r'<div class=[\'"]stability[\'"]'), {'stability_div': True}),
+    'item_info_div': (re.compile(r'<div class=[\'"]item-info[\'"]'), {'item_info': True, 'item_info_span': False}),
+    'item_info_span': (re.compile(r'<span class=[\'"]item-info[\'"]'), {'item_info_span': True}),
+    'details': (re.compile(r'<details'), {'details': True}),
+    'fqn_heading': (re.compile(r'<h1 class=[\'"]fqn'), {'main_heading': False}),
+    'main_heading': (re.compile(r'<div class=[\'"]main-heading[\'"]'), {'main_heading': True}),
+}
+layout_plans = dict()
+marker_layout_versions = dict()
+
+
+def get_layout_plan(version_num) -> dict:
+    '''
+    Return the layout plan of `version_num`: feature (see `LAYOUT_FEATURES`) -> bool.
+    '''
+    if version_num not in layout_plans:
+        era_name = get_layout_era(version_num)
+        era_version = [first_version for (first_version, name) in LAYOUT_ERAS if name == era_name][0]
+        if era_version not in layout_plans:
+            layout_plans[era_version] = {feature: first_version <= era_version and (last_version == None or era_version <= last_version)
+                for (feature, (first_version, last_version)) in LAYOUT_FEATURES.items()}
+        layout_plans[version_num] = layout_plans[era_version]
+    return layout_plans[version_num]
+
+
+def get_layout_version(version_num, html_content) -> int:
+    '''
+    Return the version whose layout plan parses the page, which is `version_num` itself up to `LAST_KNOWN_VERSION`.
+    A page of a newer version takes the plan of the newest era matching all its markers (see `LAYOUT_MARKERS`), or the
+    newest era if none matches. Results are memoized by the markers found, so each layout is matched only once.
+    '''
+    if version_num <= LAST_KNOWN_VERSION:
+        return version_num
+    if isinstance(html_content, bytes):
+        html_content = html_content.decode('utf-8', 'replace')
+    markers = set(marker for (marker, (pattern, features)) in LAYOUT_MARKERS.items() if pattern.search(html_content))
+    if 'main_heading' in markers:
+        markers.discard('fqn_heading') # `h1.fqn` is in `div.main-heading` since 1.58.0.
+    markers = frozenset(markers)
+    if markers not in marker_layout_versions:
+        layout_version = LAYOUT_ERAS[-1][0]
+        for (first_version, name) in reversed(LAYOUT_ERAS):
+            plan = get_layout_plan(first_version)
+            if all(plan[feature] == value for marker in markers for (feature, value) in LAYOUT_MARKERS[marker][1].items()):
+                layout_version = first_version
+                break
+        marker_layout_versions[markers] = layout_version
+    return marker_layout_versions[markers]
 
 
 
@@ -189,9 +796,10 @@ def get_stability(item, version_num) -> str:
     if item.name not in ['div', 'span']:
         return None
     item_class = item.get('class', [''])
-    if version_num <= 48 and item_class[0] == 'stability':
+    plan = get_layout_plan(version_num)
+    if plan['stability_div'] and item_class[0] == 'stability':
         return item.text
-    if version_num >= 49 and item_class[0] == 'item-info':
+    if plan['item_info'] and item_class[0] == 'item-info':
         return item.text
     return None
 
@@ -199,7 +807,7 @@ def get_stability(item, version_num) -> str:
 
 # Sometimes it includes `\u24d8` which is followed by notable-trait info, useless in our study.
 def get_api(item, version_num = 0) -> str:
-    if version_num >= 52:
+    if get_layout_plan(version_num)['details']:
         if item and item.h3 and item.h3.code:
             return item.h3.code.text
         elif item and item.h4:
@@ -378,7 +986,7 @@ def is_details_collapsed(div, version_num = 0) -> str:
                 return 'collapsed'
             if inner_div.find('section', recursive = False):
                 return 'collapsed'
-            if version_num == 53 and inner_div.find('div', recursive = False):
+            if get_layout_plan(version_num)['details_div'] and inner_div.find('div', recursive = False):
                 return 'collapsed'
     return 'notcollapsed'
 
@@ -429,7 +1037,7 @@ def parse_single_detail_function(function_detail, version_num) -> dict:
         if inner.name == 'summary':
             if get_api(inner, version_num) == '':
                 continue
-            if version_num >= 52:
+            if get_layout_plan(version_num)['details']:
                 for item in inner.find_all(recursive = False):
                     stability = get_stability(item, version_num)
                     if stability:
@@ -442,7 +1050,7 @@ def parse_single_detail_function(function_detail, version_num) -> dict:
             function['stability'].append(stability)
     if function['api'] == '':
         alternative_api = get_api(function_detail, version_num)
-        if version_num >= 52 and alternative_api != '':
+        if get_layout_plan(version_num)['details'] and alternative_api != '':
             function['api'] = alternative_api
             # print('alternative api' ,alternative_api)
         else:
@@ -458,8 +1066,9 @@ def parse_html_detail_impl_items(detail, version_num) -> dict:
         print('cannot find impl head', detail.text)
     impl['impl'] = get_api(detail.find('summary', recursive = False), version_num)
     # print('impl:', impl['impl'])
+    plan = get_layout_plan(version_num)
     for possible_div in detail.find_all('div', recursive = False):
-        if version_num == 53:
+        if plan['details_div']:
             for inner_div in possible_div.find_all('div', recursive = False):
                 # print(inner_div.text)
                 function = parse_single_detail_function(inner_div, version_num)
@@ -473,7 +1082,7 @@ def parse_html_detail_impl_items(detail, version_num) -> dict:
                     if function:
                         impl['functions'].append(function.copy())
             else:
-                if version_num == 52:
+                if plan['details_h4']:
                     for hidden_h4 in inner_detail.find_all('h4', recursive = False):
                         # print(hidden_h4.text)
                         function = parse_single_detail_function(hidden_h4, version_num)
@@ -502,7 +1111,7 @@ def parse_html_h2items_details(h2, version_num) -> list:
     Since 1.52.0, impls are not stored in `h3` but `details` instead. Other formats change, too.
     We use this function to parse them.
     '''
-    assert version_num >= 52, 'This function is only for version >= 1.52.0'
+    assert get_layout_plan(version_num)['details'], 'This function is only for version >= 1.52.0'
     impl = empty_impl()
     impl_list = list()
     # First, we check if they are specific cases
@@ -529,7 +1138,7 @@ def parse_html_h2items_details(h2, version_num) -> list:
             return impl_list
         elif sibling.name == 'div':
             # We handle `trait` data type seperately as they are not listed in `details`
-            if version_num == 52 and sibling.get('class', [''])[0] == 'methods':
+            if get_layout_plan(version_num)['details_h4'] and sibling.get('class', [''])[0] == 'methods':
                 functions = parse_html_div_items(sibling, version_num)
                 if functions:
                     impl['functions'] = functions
@@ -604,6 +1213,7 @@ def parse_html_h2items(h2, version_num) -> list:
     #         return impl_list
     impl = empty_impl()
     impl_list = list()
+    plan = get_layout_plan(version_num)
     for sibling in h2.next_siblings:
         if sibling.name == 'h2':
             return impl_list
@@ -617,9 +1227,9 @@ def parse_html_h2items(h2, version_num) -> list:
             impl['impl'] = sibling.code.text
         elif sibling.name == 'div':
             # Collapsed impls are in `div` list.
-            if version_num >= 21 and impl['impl'] == '' and is_h3h4_collapsed(sibling):
+            if plan['h3h4_indiv'] and impl['impl'] == '' and is_h3h4_collapsed(sibling):
                 return parse_h3h4_indiv(sibling, version_num)
-            if version_num >= 38 and impl['impl'] == '' and is_fields_indiv(sibling):
+            if plan['fields_indiv'] and impl['impl'] == '' and is_fields_indiv(sibling):
                 impl['functions'] =  parse_fields_indiv(sibling, version_num)
                 impl_list.append(impl.copy())
                 return impl_list
@@ -702,7 +1312,7 @@ def parse_html_inband(soup, version_num):
     submodule['path'] = path
     submodule['api'] = api
     # Stabilibty
-    if version_num >= 58:
+    if get_layout_plan(version_num)['main_heading']:
         head = soup.find('div', class_='main-heading')
     else:
         head = soup.find('h1', class_='fqn')
@@ -717,20 +1327,31 @@ def parse_html_inband(soup, version_num):
 
 
 # From 1.58.0, the header is not organized with the beginning of `h1` with class `fqn`.
-def parse_html(html_path, version_num):
+def parse_html(html_path, version_num, html_content = None, options = None):
     '''
     Here we will parse html file, which may be a module or submodule (e.g. function, struct, enum).
+    If `html_content` is given (e.g. read from archive), `html_path` is only used to recognize the page.
+    `options` selects how the html is parsed, see `default_parse_options()`.
     @Algorithm:
     1. We first call `parse_html_inband()` to get html metadata.
     2. Then, we parse all h2 items, which are implementations of the submodules.
     '''
     # print('Parsing html', html_path)
-    html_content = open(html_path, 'r').read()
-    soup = BeautifulSoup(html_content, 'html.parser')
-
+    if options == None:
+        options = default_parse_options()
     # We don't analyse sepcial htmls.
     if 'all.html' in html_path:
         return None
+    if html_content == None:
+        html_content = open(html_path, 'rb' if options['read_bytes'] else 'r').read()
+    version_num = get_layout_version(version_num, html_content)
+    plan = get_layout_plan(version_num)
+    if options['extractor'] == 'stream' and version_num <= STREAM_MAX_VERSION:
+        try:
+            return parse_html_stream(html_path, version_num, html_content)
+        except StreamFallback as e:
+            stream_fallbacks[str(e)] = stream_fallbacks.get(str(e), 0) + 1
+    soup = make_soup(html_content, options['parser'], options['scoped'])
 
     is_module = False
     if '/index.html' in html_path:
@@ -744,7 +1365,7 @@ def parse_html(html_path, version_num):
     # Parse all h2 items if submodules
     if not is_module:
         inner_list = list()
-        if version_num >= 58:
+        if plan['main_heading']:
             head = soup.find('div', class_='main-heading')
         else:
             head = soup.find('h1', class_='fqn')
@@ -752,7 +1373,7 @@ def parse_html(html_path, version_num):
             if sibling.name == 'h2':
                 inner = empty_item()
                 inner['head'] = " ".join(sibling.text.split()) # head text contain duplicate spaces and new lines. We remove them.
-                if version_num >= 52:
+                if plan['details']:
                     if inner['head'] not in ['Tuple Fields', 'Fields', 'Variants']:
                         impl_list = parse_html_h2items_details(sibling, version_num)
                         if len(impl_list) != 0:
@@ -764,9 +1385,9 @@ def parse_html(html_path, version_num):
 
     # Check if all ruf are collected
     collected_unstable_count = get_unstable_count(submodule)
-    if version_num <= 48:
+    if plan['stability_div']:
         stability_items = soup.find_all('div', class_='stability')
-    elif version_num >= 61:
+    elif plan['item_info_span']:
         stability_items = soup.find_all('span', class_='item-info')
     else:
         stability_items = soup.find_all('div', class_='item-info')
@@ -777,181 +1398,2108 @@ def parse_html(html_path, version_num):
     return (submodule, collected_unstable_count, html_unstable_count)
 
 
-def get_crates(doc_directory):
+# Single-pass extractor. Soup extractor walks the tree many times (siblings of every h2, collapsed checks, `find_all`).
+# Here we keep only the few elements it looks at while parsing, then extract them in one walk.
+# Only old layouts (<= 1.48.0) are handled. Pages it cannot recognize fall back to soup.
+STREAM_MAX_VERSION = 48
+STREAM_RECORD_DEPTH = 4 # We keep elements up to this depth below the parent of `h1.fqn`.
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+stream_fallbacks = dict() # reason -> count of pages of this process which fell back to soup, see `test_parser_backends()`
+
+
+class StreamFallback(Exception):
     '''
-    Use brower engine to render the root html. In this way, we can get crates.
+    The single-pass extractor cannot handle the page. It should be parsed with soup instead.
+    Where the soup extractor would fail (e.g. missing `code`), we raise it too, so errors are the same.
     '''
-    std_index_path = doc_directory + '/std/index.html'
-    # Use brower to render html to get full content
-    # service = Service(GeckoDriverManager().install())
-    # browser = webdriver.Firefox(service=service)
-    service = Service('./geckodriver')
-    browser = webdriver.Firefox(service=service)
-    browser.get('file:///'+std_index_path)
-    html = browser.page_source
-    browser.quit()
-    soup = BeautifulSoup(html, 'html.parser')
-    crates = soup.find_all('a', class_='crate')
-    crates_string = list()
-    for crate in crates:
-        crates_string.append(crate.string)
-    return crates_string
 
 
+class StreamRecord:
+    '''
+    Element kept by `StreamExtractor`. We only store what the extractor looks at.
+    '''
+    __slots__ = ['name', 'attrs', 'children', 'text', 'code', 'stabilities']
 
+    def __init__(self, name, attrs, keep_children):
+        self.name = name
+        self.attrs = attrs
+        self.children = list() if keep_children else None
+        self.text = None # Text parts. Only collected for elements whose text is used.
+        self.code = None # Text parts of the first `code` descendant.
+        self.stabilities = list() # Text parts of every `div.stability` descendant. Only collected for `tr`.
 
 
-def test_html_pre_types():
+class StreamExtractor(HTMLParser):
     '''
-    Test Results:
-    1. Submodule in-band may not contain its type in early rustdoc. In this way, we search for its api instead (pre['class'][1])
-    2. All possible (in-band -> pre['class'][1]) found now: {'Macro': {'macro', 'rust-example-rendered'},
-        'List': set(), 'Struct': {'struct', 'rust-example-rendered'}, 'Trait': {'trait', 'rust-example-rendered'},
-        'Type': {'rust-example-rendered', 'typedef'}, 'Enum': {'rust-example-rendered', 'enum'},
-        'Function': {'rust-example-rendered', 'fn'}, 'Constant': {'const', 'rust-example-rendered'},
-        'Union': {'rust-example-rendered', 'union'}, 'Primitive': {'rust-example-rendered'}, 'Keyword': {'rust-example-rendered'}}
-    3. In-band "Primitive", "Keyword" have no API, just like modules. We should handle them seperately. We better not assume they are the only exceptions.
+    Collect what `parse_html()` needs from parser events, without building soup.
+    Tags are opened and closed the same way as `BeautifulSoup` with `html.parser`, so the kept elements are the same.
+    We collect:
+    1. Elements after `h1.fqn` (and their children, see `STREAM_RECORD_DEPTH`) -> `self.records`.
+    2. The first `span.in-band`, every `pre` with two classes and the count of `div.stability` in the page.
     '''
-    all_types = dict()
+    def __init__(self):
+        super().__init__(convert_charrefs = True)
+        self.stack = [['[document]', None, None, None]] # Open elements: [name, depth, record, text parts]
+        self.texts = list() # Text parts of open elements collecting text.
+        self.data = list()
+        self.preserve_whitespace = 0
+        self.records = None
+        self.in_band = None
+        self.pres = list() # -> (api type, text parts)
+        self.stability_count = 0
+
+    def flush_data(self):
+        # Same as `BeautifulSoup.endData()`: strings of only whitespace are collapsed, except in `pre`.
+        if not self.data:
+            return
+        data = ''.join(self.data)
+        self.data = list()
+        if self.preserve_whitespace == 0 and data.strip(ASCII_SPACES) == '':
+            data = '\n' if '\n' in data else ' '
+        for text in self.texts:
+            text.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        self.flush_data()
+        attrs = dict((key, '' if value == None else value) for key, value in attrs)
+        classes = attrs.get('class', '').split()
+        if tag in HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS and self.texts:
+            # Soup does not count their strings as text.
+            raise StreamFallback('Text in ' + tag)
+        parent = self.stack[-1]
+        depth = None
+        if parent[1] != None and parent[1] < STREAM_RECORD_DEPTH:
+            depth = parent[1] + 1
+        if tag == 'h1' and 'fqn' in classes and self.records == None:
+            # Start to keep siblings of `h1.fqn`.
+            parent[1] = 0
+            depth = None
+            self.records = list()
+        record = None
+        if depth != None:
+            record = StreamRecord(tag, attrs, depth < STREAM_RECORD_DEPTH)
+            if parent[2] == None:
+                self.records.append(record)
+            else:
+                parent[2].children.append(record)
+
+        text = None
+        if tag == 'code' and self.records != None:
+            text = list()
+            for frame in reversed(self.stack):
+                if frame[2] != None:
+                    if frame[2].code != None:
+                        break
+                    frame[2].code = text
+        if tag == 'span' and 'in-band' in classes and self.in_band == None:
+            text = list() if text == None else text
+            self.in_band = text
+        if tag == 'pre' and len(classes) == 2:
+            text = list() if text == None else text
+            self.pres.append((classes[1], text))
+        if tag == 'div' and 'stability' in classes:
+            self.stability_count += 1
+            for frame in self.stack:
+                if frame[2] != None and frame[2].name == 'tr':
+                    text = list() if text == None else text
+                    frame[2].stabilities.append(text)
+        if record != None and (tag in ['h2', 'code'] or (tag in ['div', 'span'] and classes[:1] == ['stability'])):
+            text = list() if text == None else text
+            record.text = text
+
+        self.stack.append([tag, depth, record, text])
+        if text != None:
+            self.texts.append(text)
+        if tag in HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace += 1
+        if tag in HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self.flush_data()
+        # Close the nearest open tag with the same name. End tags with no open tag are ignored.
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index][0] == tag:
+                break
+        else:
+            return
+        while len(self.stack) > index:
+            frame = self.stack.pop()
+            if frame[3] != None:
+                self.texts.pop()
+            if frame[0] in HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS:
+                self.preserve_whitespace -= 1
 
-    MIN_VERSION = 40
-    MAX_VERSION = 50
-    for i in range(MIN_VERSION, MAX_VERSION+1):
-        version_num = '1.' + str(i) + '.0'
-        print('Parsing', version_num, '......')
-        doc_directory = '/media/loancold/HardDisk/ProjectInDisk/rustdoc_html_parser/' + version_num + '/rust-docs-nightly-x86_64-unknown-linux-gnu/rust-docs/share/doc/rust/html'
-        crates_item = get_crates(doc_directory)
-        # Find all html
-        for crate in crates_item:
-            crate = crate.string
-            if crate == 'test':
-                continue
-            crate_directory = doc_directory + '/' + crate
-            for file_name in glob(crate_directory + '/**/*.html', recursive=True):
-                html_content = open(file_name, 'r').read()
-                soup = BeautifulSoup(html_content, 'html.parser')
-                if 'index.html' in file_name:
-                    continue
-                span = soup.find('span', class_='in-band')
-                if not span:
-                    # Some htmls have redirection. The html itself is empty.
-                    continue
-                item = span.text.split()
-                kind = item[0]
-                if len(item) == 1:
-                    continue
-                kind_types = all_types.get(kind, set())
-                for pre in get_pres(soup):
-                    kind_types.add(pre['class'][1])
-                all_types[kind] = kind_types
-    print(all_types)
+    def handle_data(self, data):
+        self.data.append(data)
 
+    def handle_comment(self, data):
+        self.flush_data()
 
+    def handle_decl(self, decl):
+        self.flush_data()
 
-div_class_set = set()
-# Check all possible `div` class
-# Found real: 'impl-items', 'methods'. Some have no class, which remain a problem.
-def test_div_types(html_path):
-    print('Parsing html', html_path)
-    html_content = open(html_path, 'r').read()
-    soup = BeautifulSoup(html_content, 'html.parser')
-    soup = soup.find('section', {'id' : 'main'})
-    if not soup:
-        return
-    for div in soup.find_all('div'):
-        div_class = div.get('class', [''])[0]
-        div_class_set.add(div_class)
-        if div_class not in ['impl-items', 'methods'] and \
-            div_class not in ['docblock', 'stability', 'stab', 'important-traits', 'content'] \
-            and div.find('code'):
-            print('Has CODE', div_class, div)
+    def handle_pi(self, data):
+        self.flush_data()
 
+    def unknown_decl(self, data):
+        # Soup keeps CDATA as text.
+        raise StreamFallback('CDATA')
 
+    def close(self):
+        super().close()
+        self.flush_data()
 
-stab_set = set()
-def test_stab_items(html_path):
-    # print('Parsing html', html_path)
-    html_content = open(html_path, 'r').read()
-    soup = BeautifulSoup(html_content, 'html.parser')
-    soup = soup.find_all('div')
-    for div in soup:
-        div_class = div.get('class', [''])
-        if div_class[0] == 'item-info':
-            for stab in div.find_all('div', class_ = 'stab'):
-                div_class_string = ''
-                for div_class_item in stab.get('class', ['']):
-                    div_class_string += div_class_item + ' '
-                stab_set.add(div_class_string)
 
+def get_record_text(text) -> str:
+    return ''.join(text)
 
 
+def get_record_class(record) -> str:
+    '''
+    Same as `item.get('class', [''])[0]` in soup.
+    '''
+    if 'class' not in record.attrs:
+        return ''
+    classes = record.attrs['class'].split()
+    if len(classes) == 0:
+        raise StreamFallback('Empty class')
+    return classes[0]
 
 
-def parse_all_docs(MIN_VERSION = 1, MAX_VERSION = 63):
-    '''
-    Parse all rustdocs to get items data in different compiler versions.
-    These data are actually Abstract Resource Tree. Through analysing AST, we can know API evolution, especially unstable API.
-    @Algorithm:
-    1. We first parse root doc and call `get_crates()` to get all standard library crates, which we will then parse them.
-    2. We call `parse_html()` to parse all html files, which contain AST of all data (e.g. modules, primitives, functions, structs).
+def find_record(record, name):
+    for child in record.children:
+        if child.name == name:
+            return child
+    return None
 
-    '''
-    for i in range(MIN_VERSION, MAX_VERSION+1):
-        version_num = '1.' + str(i) + '.0'
-        # Find root html: std/index.html
-        current_directory = os.getcwd() + '/'
-        doc_directory = current_directory + version_num + '/rust-docs-nightly-x86_64-unknown-linux-gnu/rust-docs/share/doc/rust/html'
-        if i == 52: # This is exception
-            crates_string = ['alloc', 'core', 'proc_macro', 'std']
-        else:
-            crates_string = get_crates(doc_directory)
 
-        # Find all html
-        total_unstable_collected = 0
-        total_unstable_exist = 0
-        for crate in crates_string:
-            if crate == 'test':
-                continue
-            crate_directory = doc_directory + '/' + crate
-            for file_name in glob(crate_directory + '/**/*.html', recursive=True):
-                tuples = parse_html(file_name, i)
-                if tuples == None:
-                    continue
-                (submodule, collected_unstable_count, html_unstable_count) = tuples
-                total_unstable_collected += collected_unstable_count
-                total_unstable_exist += html_unstable_count
-                # Store submodule data into json
-                root_directory = file_name.split('rust-docs/share/doc/rust/html')[0]
-                relative_directory = file_name.split('rust-docs/share/doc/rust/html')[1]
-                json_file_path = root_directory + 'json_submodule' + relative_directory + '.json'
-                # print(json_file_path)
-                os.makedirs(os.path.dirname(json_file_path), exist_ok=True)
-                with open(json_file_path, 'w+') as file:
-                    json.dump(submodule, file)
-                # test_div_types(file_name)
-                # test_stab_items(file_name)
-                # print(stab_set)
-                # print(stab_set)
-        print(version_num, total_unstable_collected, total_unstable_exist)
+def get_record_stability(record) -> str:
+    # `get_stability()` before 1.49.0
+    if record.name not in ['div', 'span']:
+        return None
+    if get_record_class(record) == 'stability':
+        return get_record_text(record.text)
+    return None
 
 
-# parse_all_docs(60,63)
-# crawl_rustdoc()
-# test_html_pre_types()
-# parse_all_docs()
-# print(div_class_set)
-# print_pretty(parse_html('/home/loancold/Projects/rustdoc_parser/1.52.0/rust-docs-nightly-x86_64-unknown-linux-gnu/rust-docs/share/doc/rust/html/core/result/struct.Iter.html', 52))
-import sys
-if sys.argv[1] == 'complete':
-    parse_all_docs()
-elif sys.argv[1] == 'complete_selected':
-    parse_all_docs(int(sys.argv[2]), int(sys.argv[3]))
-elif sys.argv[1] == 'test_serial':
-    submodule = parse_html(sys.argv[2], int(sys.argv[3]))[0]
-    with open('test_serial.json', 'w') as file:
-        json.dump(submodule, file)
-else:
-    print_pretty(parse_html(sys.argv[1], int(sys.argv[2]))[0])
+def get_record_api(record) -> str:
+    # `get_api()` before 1.52.0
+    span = find_record(record, 'span')
+    if span and span.code != None:
+        return get_record_text(span.code)
+    code = find_record(record, 'code')
+    if code:
+        return get_record_text(code.text)
+    if record.code == None:
+        return ''
+    return get_record_text(record.code)
+
+
+def get_record_code(record) -> str:
+    # `item.code.text`, which fails without `code`.
+    if record.code == None:
+        raise StreamFallback('No code in ' + record.name)
+    return get_record_text(record.code)
+
+
+def parse_stream_div_items(div, version_num) -> list:
+    # `parse_html_div_items()`
+    h3_start = find_record(div, 'h3')
+    h4_start = find_record(div, 'h4')
+    if h3_start and h4_start:
+        print('div contains both h3 and h4')
+    tag_start = h4_start
+    parse_tag = 'h4'
+    if h3_start:
+        tag_start = h3_start
+        parse_tag = 'h3'
+    if not tag_start:
+        return None
+
+    function = empty_function()
+    function['api'] = get_record_api(tag_start)
+    function_list = list()
+    for sibling in div.children[div.children.index(tag_start) + 1:]:
+        if sibling.name == parse_tag:
+            function_list.append(function.copy())
+            function = empty_function()
+            function['api'] = get_record_api(sibling)
+        stability = get_record_stability(sibling)
+        if stability:
+            function['stability'].append(stability)
+        if sibling.name == 'h2':
+            break
+    function_list.append(function.copy())
+    return function_list
+
+
+def parse_stream_fields_indiv(records, index, version_num) -> list:
+    # `parse_fields_indiv()`
+    function = empty_function()
+    function['api'] = get_record_code(records[index])
+    function_list = list()
+    for sibling in records[index + 1:]:
+        if sibling.name == 'div' and find_record(sibling, 'code'):
+            function_list.append(function.copy())
+            function = empty_function()
+            function['api'] = get_record_code(sibling)
+        stability = get_record_stability(sibling)
+        if stability:
+            function['stability'].append(stability)
+        if sibling.name == 'h2':
+            break
+    function_list.append(function.copy())
+    return function_list
+
+
+def parse_stream_spanitems(records, index, version_num) -> list:
+    # `parse_html_spanitems()`
+    first_span = records[index]
+    if first_span.code == None:
+        return None
+    div = find_record(first_span, 'div')
+    if div:
+        return parse_stream_div_items(div, version_num)
+    function = empty_function()
+    function['api'] = get_record_text(first_span.code)
+    function_list = list()
+    for sibling in records[index + 1:]:
+        if sibling.name == 'span':
+            if sibling.code == None:
+                continue
+            function_list.append(function.copy())
+            function = empty_function()
+            function['api'] = get_record_text(sibling.code)
+        stability = get_record_stability(sibling)
+        if stability:
+            function['stability'].append(stability)
+        if sibling.name == 'h2':
+            break
+    function_list.append(function.copy())
+    return function_list
+
+
+def process_stream_fields(records, index, version_num) -> list:
+    # `process_fileds()`
+    tag = records[index]
+    if tag.name == 'table':
+        function_list = list()
+        for tr in tag.children:
+            if tr.name != 'tr':
+                continue
+            function = empty_function()
+            function['api'] = get_record_code(tr)
+            for stability in tr.stabilities:
+                function['stability'].append(get_record_text(stability))
+            function_list.append(function.copy())
+        return function_list
+    elif tag.name == 'span':
+        return parse_stream_spanitems(records, index, version_num)
+    else:
+        return None
+
+
+def is_stream_h3h4_collapsed(div) -> bool:
+    # `is_h3h4_collapsed()`
+    for index, h3 in enumerate(div.children):
+        if h3.name != 'h3':
+            continue
+        for sibling in div.children[index + 1:]:
+            if sibling.name == 'div':
+                h4 = find_record(sibling, 'h4')
+                if h4 and h4.code != None:
+                    return True
+            if sibling.name == 'h3':
+                break
+    return False
+
+
+def parse_stream_h3h4_indiv(div, version_num) -> list:
+    # `parse_h3h4_indiv()`
+    first_h3 = find_record(div, 'h3')
+    impl_list = list()
+    impl = empty_impl()
+    impl['impl'] = get_record_code(first_h3)
+    for sibling in div.children[div.children.index(first_h3) + 1:]:
+        if sibling.name == 'h3':
+            impl = empty_impl()
+            impl['impl'] = get_record_code(sibling)
+        if sibling.name == 'div':
+            functions = parse_stream_div_items(sibling, version_num)
+            if functions:
+                impl['functions'] = functions
+                impl_list.append(impl.copy())
+    return impl_list
+
+
+def parse_stream_h2items(records, index, version_num) -> list:
+    # `parse_html_h2items()` before 1.52.0
+    impl = empty_impl()
+    impl_list = list()
+    plan = get_layout_plan(version_num)
+    for sibling_index in range(index + 1, len(records)):
+        sibling = records[sibling_index]
+        if sibling.name == 'h2':
+            return impl_list
+        elif sibling.name == 'h3':
+            impl = empty_impl()
+            if sibling.code == None:
+                if 'id' not in sibling.attrs:
+                    raise StreamFallback('h3 has no code and id')
+                if not sibling.attrs['id'] == 'derived_implementations':
+                    print('h3 has no code', sibling.attrs)
+                continue
+            impl['impl'] = get_record_text(sibling.code)
+        elif sibling.name == 'div':
+            if plan['h3h4_indiv'] and impl['impl'] == '' and is_stream_h3h4_collapsed(sibling):
+                return parse_stream_h3h4_indiv(sibling, version_num)
+            if plan['fields_indiv'] and impl['impl'] == '' and find_record(sibling, 'code'):
+                impl['functions'] = parse_stream_fields_indiv(records, sibling_index, version_num)
+                impl_list.append(impl.copy())
+                return impl_list
+            functions = parse_stream_div_items(sibling, version_num)
+            if functions:
+                impl['functions'] = functions
+                impl_list.append(impl.copy())
+        elif sibling.name == 'ul':
+            impl = empty_impl()
+            if 'implementors-list' not in sibling.attrs.get('id', ''):
+                raise StreamFallback('Unknown ul')
+            if 'class' not in sibling.attrs:
+                raise StreamFallback('ul has no class')
+            impl['impl'] = get_record_class(sibling)
+            # Soup extractor passes `'li'` as version here, and only works if there are no h3/h4.
+            if find_record(sibling, 'h3') or find_record(sibling, 'h4'):
+                raise StreamFallback('h3/h4 in implementors list')
+        else:
+            function_list = process_stream_fields(records, sibling_index, version_num)
+            if function_list:
+                impl['functions'] = function_list
+                impl_list.append(impl.copy())
+                return impl_list
+    return impl_list
+
+
+def parse_html_stream(html_path, version_num, html_content):
+    '''
+    Same as `parse_html()`, but parsing the html only once with `StreamExtractor`.
+    Raise `StreamFallback` if the page is not recognized.
+    '''
+    assert version_num <= STREAM_MAX_VERSION, 'Single-pass extractor is only for version <= 1.48.0'
+    if 'all.html' in html_path:
+        return None
+    if isinstance(html_content, bytes):
+        html_content = html_content.decode('utf-8')
+    extractor = StreamExtractor()
+    extractor.feed(html_content)
+    extractor.close()
+
+    # Metadata, same as `parse_html_inband()`
+    submodule = empty_submodule()
+    if extractor.in_band == None:
+        return None
+    item = get_record_text(extractor.in_band).split()
+    path = ''
+    if len(item) == 1:
+        path = item[0]
+    elif len(item) == 3:
+        if item[0] not in ['Primitive', 'Type', 'Foreign']:
+            print("Complex kind detected", item)
+        path = item[2]
+    elif len(item) == 2:
+        path = item[1]
+    else:
+        raise StreamFallback('Unknown in-band')
+    # `kind` is always recovered from api type, like `parse_html_inband()` does.
+    api = ''
+    api_type = ''
+    for (pre_type, text) in extractor.pres:
+        if pre_type != 'rust-example-rendered':
+            if api != '':
+                raise StreamFallback('Two apis')
+            api_type = pre_type
+            api = get_record_text(text)
+    if api_type not in api_mappings:
+        return None
+    submodule['kind'] = api_mappings[api_type]
+    submodule['path'] = path
+    submodule['api'] = api
+    if extractor.records == None:
+        raise StreamFallback('No h1.fqn')
+    records = extractor.records
+    for record in records:
+        if record.name == 'h2':
+            break
+        stability = get_record_stability(record)
+        if stability:
+            submodule['stability'].append(stability)
+
+    # Items, same as `parse_html()`
+    if '/index.html' not in html_path:
+        inner_list = list()
+        for (index, record) in enumerate(records):
+            if record.name == 'h2':
+                inner = empty_item()
+                inner['head'] = " ".join(get_record_text(record.text).split())
+                inner['impls'] = parse_stream_h2items(records, index, version_num)
+                inner_list.append(inner.copy())
+        submodule['items'] = inner_list
+
+    collected_unstable_count = get_unstable_count(submodule)
+    html_unstable_count = extractor.stability_count
+    if collected_unstable_count != html_unstable_count:
+        print('misses unstable items', collected_unstable_count, html_unstable_count)
+    return (submodule, collected_unstable_count, html_unstable_count)
+
+
+def get_crates_from_browser(doc_directory):
+    '''
+    Use brower engine to render the root html. In this way, we can get crates.
+    This is slow and needs Firefox with geckodriver. Only used as fallback of `get_crates()`.
+    '''
+    from selenium import webdriver
+    from selenium.webdriver.firefox.service import Service
+    std_index_path = doc_directory + '/std/index.html'
+    # Use brower to render html to get full content
+    # service = Service(GeckoDriverManager().install())
+    # browser = webdriver.Firefox(service=service)
+    service = Service('./geckodriver')
+    browser = webdriver.Firefox(service=service)
+    browser.get('file:///'+std_index_path)
+    html = browser.page_source
+    browser.quit()
+    soup = BeautifulSoup(html, 'html.parser')
+    crates = soup.find_all('a', class_='crate')
+    crates_string = list()
+    for crate in crates:
+        crates_string.append(crate.string)
+    return crates_string
+
+
+# The crate list in `std/index.html` is rendered by javascript from static files in the html root.
+# `crates.js` (e.g. `crates1.52.0.js`) only exists in newer versions. `search-index.js` exists in all versions.
+def is_crates_js(file_name) -> bool:
+    return re.fullmatch('crates[0-9.]*\\.js', file_name) != None
+
+
+def is_search_index_js(file_name) -> bool:
+    return re.fullmatch('search-index[0-9.]*\\.js', file_name) != None
+
+
+def read_crates_from_js(file_name, content) -> list:
+    '''
+    Read crates from `crates.js` or `search-index.js`. Return `None` if not recognized.
+    Formats:
+    1. crates.js: `window.ALL_CRATES = ["alloc","core",...];`
+    2. Old search-index.js: `searchIndex["alloc"] = {...};` (or `searchIndex['alloc']`), one crate per line.
+       Minified in some versions: `var N=null,E="",T="t",U="u",searchIndex={};` declares aliases the crate indexes use
+       (e.g. `[3,"Box","alloc::boxed",E,N,N]`), see `read_search_index()`.
+    3. New search-index.js: `var searchIndex = JSON.parse('{"alloc":{...},"core":{...}}');`
+    '''
+    if is_crates_js(file_name):
+        matched = re.search('ALL_CRATES\\s*=\\s*(\\[[^\\]]*\\])', content)
+        if matched:
+            return sorted(json.loads(matched[1]))
+        return None
+    crates = re.findall('searchIndex\\[[\'"]([^\'"]+)[\'"]\\]\\s*=', content)
+    if len(crates) != 0:
+        return sorted(set(crates))
+    search_index = read_search_index_json(content)
+    if search_index != None:
+        return sorted(search_index.keys())
+    return None
+
+
+def read_search_index_json(content) -> dict:
+    '''
+    Read search index in `JSON.parse('...')` format. Return `None` if it is not in this format.
+    The json is in a javascript single quoted string. We unescape it before loading.
+    '''
+    start = content.find("JSON.parse('")
+    end = content.rfind("')")
+    if start == -1 or end <= start:
+        return None
+    js_string = content[start + len("JSON.parse('"):end]
+    # `\<newline>` is line continuation. `\'` and `\\` are escaped quote and backslash.
+    json_string = re.sub('\\\\(\n|.)', lambda matched: '' if matched[1] == '\n' else matched[1], js_string)
+    try:
+        return json.loads(json_string)
+    except ValueError:
+        return None
+
+
+# Item kinds in the search index are indexes of rustdoc `ItemType`. Names are the prefixes of page names (e.g. `struct.Vec.html`).
+ITEM_TYPES = ['mod', 'externcrate', 'import', 'struct', 'enum', 'fn', 'type', 'static', 'trait', 'impl', 'tymethod', 'method',
+    'structfield', 'variant', 'macro', 'primitive', 'associatedtype', 'constant', 'associatedconstant', 'union', 'foreigntype',
+    'keyword', 'opaque', 'attr', 'derive', 'traitalias']
+# Kinds without a page of their own, and not documented on the page of a parent.
+PAGELESS_ITEM_TYPES = ['externcrate', 'import', 'impl']
+
+
+SEARCH_INDEX_CRATE_PATTERN = re.compile('searchIndex\\[[\'"]([^\'"]+)[\'"]\\]\\s*=\\s*')
+JS_ALIAS_PATTERN = re.compile(r'(?:\bvar\s+|,)\s*([A-Za-z_$][\w$]*)\s*=\s*')
+# Strings are kept as they are. Other names are aliases if declared, with an optional index into them (e.g. `R[12]`).
+JS_NAME_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|(?<![\w$.])([A-Za-z_$][\w$]*)(?:\[(\d+)\])?')
+
+
+def get_js_aliases(header) -> dict:
+    '''
+    Return name -> value of the variables a minified `search-index.js` declares before its crate indexes,
+    e.g. `var N=null,E="",T="t",U="u",searchIndex={};` or a table of strings `var R=["alloc","boxed",...];`.
+    '''
+    aliases = dict()
+    decoder = json.JSONDecoder()
+    for matched in JS_ALIAS_PATTERN.finditer(header):
+        try:
+            aliases[matched[1]] = decoder.raw_decode(header, matched.end())[0]
+        except ValueError:
+            continue
+    aliases.pop('searchIndex', None)
+    return aliases
+
+
+def expand_js_aliases(content, aliases) -> str:
+    '''
+    Replace aliases (see `get_js_aliases()`) in javascript object literals by their json values, outside strings.
+    '''
+    def expand(matched):
+        if matched[1] == None or matched[1] not in aliases:
+            return matched[0]
+        value = aliases[matched[1]]
+        if matched[2] != None:
+            if not isinstance(value, list) or int(matched[2]) >= len(value):
+                return matched[0]
+            value = value[int(matched[2])]
+        return json.dumps(value)
+    if len(aliases) == 0:
+        return content
+    return JS_NAME_PATTERN.sub(expand, content)
+
+
+def read_search_index(content) -> dict:
+    '''
+    Read `search-index.js`. Return crate -> search index of the crate, or `None` if not recognized.
+    See `read_crates_from_js()` for formats. Aliases of minified indexes are expanded before decoding.
+    '''
+    first_crate = SEARCH_INDEX_CRATE_PATTERN.search(content)
+    if first_crate == None:
+        return read_search_index_json(content)
+    content = expand_js_aliases(content, get_js_aliases(content[:first_crate.start()]))
+    decoder = json.JSONDecoder()
+    search_index = dict()
+    try:
+        for matched in SEARCH_INDEX_CRATE_PATTERN.finditer(content):
+            search_index[matched[1]] = decoder.raw_decode(content, matched.end())[0]
+    except ValueError:
+        return None
+    return search_index
+
+
+def test_search_index_formats():
+    '''
+    Check `read_crates_from_js()`, `read_search_index()` and `get_search_index_items()` on a sample of each `search-index.js` format.
+    '''
+    samples = {
+        'old': 'var searchIndex = {};\n'
+            'searchIndex["alloc"] = {"doc":"","items":[[0,"boxed","alloc","",null,null],[3,"Box","alloc::boxed","",null,null],'
+            '[11,"new","","",0,null]],"paths":[[3,"Box"]]};\n'
+            'searchIndex[\'core\'] = {"doc":"","items":[[3,"Cell","core::cell","",null,null]],"paths":[]};\n'
+            'initSearch(searchIndex);\n',
+        'minified': 'var N=null,E="",T="t",U="u",searchIndex={};\n'
+            'var R=["alloc::boxed","Box"];\n'
+            'searchIndex["alloc"]={"doc":E,"i":[[0,"boxed","alloc",E,N,N],[3,R[1],R[0],E,N,N],[11,"new",E,E,0,N]],"p":[[3,R[1]]]};\n'
+            'searchIndex["core"]={"doc":E,"i":[[3,"Cell","core::cell",E,N,N]],"p":[]};\n'
+            'initSearch(searchIndex);addSearchOptions(searchIndex);\n',
+        'json': 'var searchIndex = JSON.parse(\'{\\\n'
+            '"alloc":{"doc":"","t":[0,3,11],"n":["boxed","Box","new"],"q":["alloc","alloc::boxed",""],"d":["","",""],"i":[0,0,1],'
+            '"f":[null,null,null],"p":[[3,"Box"]]},\\\n'
+            '"core":{"doc":"","t":[3],"n":["Cell"],"q":["core::cell"],"d":[""],"i":[0],"f":[null],"p":[]}\\\n'
+            '}\');\n'
+            'if (window.initSearch) {window.initSearch(searchIndex)};\n',
+    }
+    expected_pages = {
+        'alloc': ['/alloc/boxed/index.html', '/alloc/boxed/struct.Box.html', '/alloc/boxed/struct.Box.html'],
+        'core': ['/core/cell/struct.Cell.html'],
+    }
+    for (name, content) in samples.items():
+        assert read_crates_from_js('search-index.js', content) == ['alloc', 'core'], name
+        search_index = read_search_index(content)
+        assert search_index != None, name
+        pages = {crate: [item['page'] for item in get_search_index_items(crate, crate_index)] for (crate, crate_index) in search_index.items()}
+        assert pages == expected_pages, (name, pages)
+        print('Search index format', name, 'ok')
+
+
+def get_search_index_items(crate, crate_index) -> list:
+    '''
+    Return items in the search index of a crate: {'path', 'name', 'kind', 'parent', 'page'}.
+    `parent` is the name of the type methods, fields and variants belong to. They are documented on its page.
+    `page` is the html file documenting the item, relative to the html root (e.g. `/core/vec/struct.Vec.html`).
+    Formats:
+    1. Rows: `{"items": [[kind, name, path, desc, parent, type], ...], "paths": [[kind, name], ...]}` (`"i"` and `"p"` since 1.2x).
+       `parent` is an index of paths, or `null`.
+    2. Columns since 1.52.0: `{"t": [kind, ...], "n": [name, ...], "q": [path, ...], "i": [parent, ...], "p": [[kind, name], ...]}`.
+       `parent` is an index of paths plus 1, or 0.
+    In both, an empty path is the path of the item before.
+    '''
+    if 't' in crate_index:
+        rows = zip(crate_index['t'], crate_index['n'], crate_index['q'], [parent - 1 if parent else None for parent in crate_index['i']])
+    else:
+        rows = [(row[0], row[1], row[2], row[4]) for row in crate_index['items' if 'items' in crate_index else 'i']]
+    parents = crate_index['paths' if 'paths' in crate_index else 'p']
+    items = list()
+    path = crate
+    for (item_type, name, item_path, parent) in rows:
+        if item_path:
+            path = item_path
+        kind = ITEM_TYPES[item_type] if item_type < len(ITEM_TYPES) else str(item_type)
+        if kind in PAGELESS_ITEM_TYPES:
+            continue
+        directory = '/' + path.replace('::', '/')
+        if parent != None:
+            (parent_type, parent_name) = parents[parent][:2]
+            page = directory + '/' + ITEM_TYPES[parent_type] + '.' + parent_name + '.html'
+            parent = parent_name
+        elif kind == 'mod':
+            page = directory + '/' + name + '/index.html'
+        else:
+            page = directory + '/' + kind + '.' + name + '.html'
+        items.append({'path': path, 'name': name, 'kind': kind, 'parent': parent, 'page': page})
+    return items
+
+
+def get_crates_from_static(doc_directory) -> list:
+    '''
+    Read crates from `crates.js` or `search-index.js` in the html root. Return `None` if not found.
+    '''
+    file_names = sorted(os.listdir(doc_directory))
+    for file_name in [name for name in file_names if is_crates_js(name)] + [name for name in file_names if is_search_index_js(name)]:
+        with open(doc_directory + '/' + file_name, 'r') as file:
+            crates = read_crates_from_js(file_name, file.read())
+        if crates:
+            return crates
+    return None
+
+
+def get_crates(doc_directory, browser_fallback = False):
+    '''
+    Get crates of the doc. They are read from static javascript files which rustdoc ships (see `get_crates_from_static()`).
+    The browser is only used if `browser_fallback` is set and static files are not recognized.
+    '''
+    crates = get_crates_from_static(doc_directory)
+    if crates != None:
+        return crates
+    if browser_fallback:
+        print('Cannot find crates in static files, fallback to browser', doc_directory)
+        return get_crates_from_browser(doc_directory)
+    raise Exception('Cannot find crates in static files ' + doc_directory)
+
+
+def get_version_crates(version_num, doc_source, browser_fallback = False) -> list:
+    '''
+    Get crates of a version. Results are cached in `<version>/rust-docs-nightly-.../crates.json`.
+    '''
+    cache_path = get_version_directory(version_num) + '/crates.json'
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r') as file:
+            return json.load(file)
+    crates = doc_source.get_crates(browser_fallback)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, 'w') as file:
+        json.dump(crates, file)
+    return crates
+
+
+# Items of a version from the search index rustdoc ships, in `<version>/rust-docs-nightly-.../inventory.json`.
+# Only module pages are read, so it takes seconds rather than a full parse.
+INVENTORY_FILE_NAME = 'inventory.json'
+MODULE_ITEM_PATTERN = re.compile(r'module-item')
+ITEM_LINK_PATTERN = re.compile(r'<a class=["\']\w+["\'] href=["\']([^"\'#]+\.html)["\']')
+# Unstable items in module tables: `<span class="stab unstable">`, or `<div class="item-left unstable module-item">` since 1.5x.
+UNSTABLE_ITEM_PATTERN = re.compile(r'\bstab unstable\b|\bunstable module-item\b|\bstability Unstable\b')
+
+
+def get_inventory_path(version_num) -> str:
+    return get_version_directory(version_num) + '/' + INVENTORY_FILE_NAME
+
+
+def get_module_stability(html_content) -> dict:
+    '''
+    Read the item table of a module page. Return href of each item -> whether it is marked unstable.
+    Each row of the table has class `module-item`, and its first link is the item.
+    '''
+    row_starts = [html_content.rfind('<', 0, matched.start()) for matched in MODULE_ITEM_PATTERN.finditer(html_content)]
+    stability = dict()
+    for (index, row_start) in enumerate(row_starts):
+        row = html_content[row_start:row_starts[index+1] if index + 1 < len(row_starts) else len(html_content)]
+        link = ITEM_LINK_PATTERN.search(row)
+        if link:
+            stability[link[1]] = UNSTABLE_ITEM_PATTERN.search(row) != None
+    return stability
+
+
+def build_inventory(i, source = 'directory', browser_fallback = False) -> dict:
+    '''
+    List items of version `1.i.0` from its search index, and store them in the inventory file of the version:
+    {'crates': [...], 'items': [{'path', 'name', 'kind', 'parent', 'page', 'unstable'}, ...]}
+    See `get_search_index_items()` for items. `unstable` is read from the item table of the module page listing the item,
+    and is `None` for items which are not listed (e.g. methods) or whose module page is missing.
+    '''
+    version_num = '1.' + str(i) + '.0'
+    doc_source = get_doc_source(version_num, source)
+    crates = get_parse_crates(i, doc_source, browser_fallback)
+    content = doc_source.read_search_index_js()
+    search_index = read_search_index(content) if content != None else None
+    if search_index == None:
+        raise Exception('Cannot read search index of ' + version_num)
+    items = list()
+    for crate in crates:
+        if crate in search_index:
+            items += get_search_index_items(crate, search_index[crate])
+    module_pages = set('/' + crate + '/index.html' for crate in crates)
+    module_pages.update(item['page'] for item in items if item['kind'] == 'mod' and item['parent'] == None)
+    stability = dict() # page -> unstable
+    for (relative_path, html_content) in doc_source.iter_files(module_pages):
+        directory = os.path.dirname(relative_path)
+        for (href, unstable) in get_module_stability(html_content).items():
+            stability[os.path.normpath(directory + '/' + href)] = unstable
+    for item in items:
+        item['unstable'] = stability.get(item['page']) if item['parent'] == None else None
+    inventory = {'crates': crates, 'items': items}
+    write_json_file(get_inventory_path(version_num), inventory)
+    print('Inventory of', version_num + ':', len(items), 'items,', len(get_inventory_pages(inventory)), 'pages,',
+        sum(1 for item in items if item['unstable']), 'unstable')
+    return inventory
+
+
+def load_inventory(version_num) -> dict:
+    '''
+    Return the inventory of a version (see `build_inventory()`), or `None` if it is not built.
+    '''
+    inventory_path = get_inventory_path(version_num)
+    if not os.path.exists(inventory_path):
+        return None
+    with open(inventory_path, 'r') as file:
+        return json.load(file)
+
+
+def get_inventory_pages(inventory) -> set:
+    '''
+    Return pages documenting items of the inventory, and root pages of its crates.
+    '''
+    return set(item['page'] for item in inventory['items']) | set('/' + crate + '/index.html' for crate in inventory['crates'])
+
+
+def build_inventories(MIN_VERSION = 1, MAX_VERSION = 63, source = 'directory', browser_fallback = False):
+    for i in range(MIN_VERSION, MAX_VERSION+1):
+        build_inventory(i, source, browser_fallback)
+
+
+def check_inventories(MIN_VERSION = 1, MAX_VERSION = 63, max_printed = 5):
+    '''
+    Check parse results of versions (their manifests, see `load_manifest()`) against their inventories.
+    Missing pages are in the inventory but were not parsed (e.g. the html file is not shipped). Empty pages were parsed without output.
+    Extra pages have output but are not in the inventory (e.g. pages of items hidden from search).
+    '''
+    for i in range(MIN_VERSION, MAX_VERSION+1):
+        version_num = '1.' + str(i) + '.0'
+        inventory = load_inventory(version_num)
+        manifest = load_manifest(version_num)
+        if inventory == None or manifest == None:
+            print('Cannot check', version_num + ':', 'no inventory' if inventory == None else 'no manifest')
+            continue
+        pages = get_inventory_pages(inventory)
+        parsed_pages = set(relative_path for (relative_path, entry) in manifest['files'].items() if entry['output'] != None)
+        checked_pages = {
+            'missing': sorted(pages - set(manifest['files'].keys())),
+            'empty': sorted(pages.intersection(manifest['files'].keys()) - parsed_pages),
+            'extra': sorted(parsed_pages - pages),
+        }
+        print('Inventory check of', version_num + ':', len(pages), 'pages,', ', '.join(str(len(relative_paths)) + ' ' + check
+            for (check, relative_paths) in checked_pages.items()))
+        for (check, relative_paths) in checked_pages.items():
+            for relative_path in relative_paths[:max_printed]:
+                print('    ' + check, relative_path)
+
+
+
+
+def test_html_pre_types(parser = 'html.parser'):
+    '''
+    Test Results:
+    1. Submodule in-band may not contain its type in early rustdoc. In this way, we search for its api instead (pre['class'][1])
+    2. All possible (in-band -> pre['class'][1]) found now: {'Macro': {'macro', 'rust-example-rendered'},
+        'List': set(), 'Struct': {'struct', 'rust-example-rendered'}, 'Trait': {'trait', 'rust-example-rendered'},
+        'Type': {'rust-example-rendered', 'typedef'}, 'Enum': {'rust-example-rendered', 'enum'},
+        'Function': {'rust-example-rendered', 'fn'}, 'Constant': {'const', 'rust-example-rendered'},
+        'Union': {'rust-example-rendered', 'union'}, 'Primitive': {'rust-example-rendered'}, 'Keyword': {'rust-example-rendered'}}
+    3. In-band "Primitive", "Keyword" have no API, just like modules. We should handle them seperately. We better not assume they are the only exceptions.
+    '''
+    all_types = dict()
+
+    MIN_VERSION = 40
+    MAX_VERSION = 50
+    for i in range(MIN_VERSION, MAX_VERSION+1):
+        version_num = '1.' + str(i) + '.0'
+        print('Parsing', version_num, '......')
+        doc_directory = '/media/loancold/HardDisk/ProjectInDisk/rustdoc_html_parser/' + version_num + '/rust-docs-nightly-x86_64-unknown-linux-gnu/rust-docs/share/doc/rust/html'
+        crates_item = get_crates(doc_directory)
+        # Find all html
+        for crate in crates_item:
+            if crate == 'test':
+                continue
+            crate_directory = doc_directory + '/' + crate
+            for file_name in glob(crate_directory + '/**/*.html', recursive=True):
+                html_content = open(file_name, 'r').read()
+                soup = make_soup(html_content, parser)
+                if 'index.html' in file_name:
+                    continue
+                span = soup.find('span', class_='in-band')
+                if not span:
+                    # Some htmls have redirection. The html itself is empty.
+                    continue
+                item = span.text.split()
+                kind = item[0]
+                if len(item) == 1:
+                    continue
+                kind_types = all_types.get(kind, set())
+                for pre in get_pres(soup):
+                    kind_types.add(pre['class'][1])
+                all_types[kind] = kind_types
+    print(all_types)
+
+
+
+div_class_set = set()
+# Check all possible `div` class
+# Found real: 'impl-items', 'methods'. Some have no class, which remain a problem.
+def test_div_types(html_path, parser = 'html.parser'):
+    print('Parsing html', html_path)
+    html_content = open(html_path, 'r').read()
+    soup = make_soup(html_content, parser)
+    soup = soup.find('section', {'id' : 'main'})
+    if not soup:
+        return
+    for div in soup.find_all('div'):
+        div_class = div.get('class', [''])[0]
+        div_class_set.add(div_class)
+        if div_class not in ['impl-items', 'methods'] and \
+            div_class not in ['docblock', 'stability', 'stab', 'important-traits', 'content'] \
+            and div.find('code'):
+            print('Has CODE', div_class, div)
+
+
+
+stab_set = set()
+def test_stab_items(html_path, parser = 'html.parser'):
+    # print('Parsing html', html_path)
+    html_content = open(html_path, 'r').read()
+    soup = make_soup(html_content, parser)
+    soup = soup.find_all('div')
+    for div in soup:
+        div_class = div.get('class', [''])
+        if div_class[0] == 'item-info':
+            for stab in div.find_all('div', class_ = 'stab'):
+                div_class_string = ''
+                for div_class_item in stab.get('class', ['']):
+                    div_class_string += div_class_item + ' '
+                stab_set.add(div_class_string)
+
+
+
+def diff_parse_results(result, other_result, path = '') -> list:
+    '''
+    Compare two results of `parse_html()` (or any part of them) recursively.
+    @Return list of differences, each is a string with the location of the difference.
+    '''
+    if type(result) != type(other_result):
+        return [path + ': ' + repr(result)[:200] + ' != ' + repr(other_result)[:200]]
+    if isinstance(result, dict):
+        differences = list()
+        for key in sorted(set(result.keys()) | set(other_result.keys())):
+            differences += diff_parse_results(result.get(key), other_result.get(key), path + '/' + str(key))
+        return differences
+    if isinstance(result, (list, tuple)):
+        differences = list()
+        if len(result) != len(other_result):
+            differences.append(path + ': length ' + str(len(result)) + ' != ' + str(len(other_result)))
+        for index in range(min(len(result), len(other_result))):
+            differences += diff_parse_results(result[index], other_result[index], path + '/' + str(index))
+        return differences
+    if result != other_result:
+        return [path + ': ' + repr(result)[:200] + ' != ' + repr(other_result)[:200]]
+    return list()
+
+
+def test_parser_backends(MIN_VERSION = 1, MAX_VERSION = 63, source = 'directory', options = None, other_options = None, max_printed = 5):
+    '''
+    Parse all html files with two parse options (by default `html.parser` and `lxml`), and diff the extracted submodules.
+    Use it to check that a faster option (another parser backend, scoped soup, `read_bytes`) does not change the extracted APIs.
+    Each option set is given html the way it asks for it: bytes if `read_bytes` is set, otherwise text (see `decode_html()`).
+    Results are grouped by layout era (see `LAYOUT_ERAS`), as parsing differences are usually era-specific.
+    To check the stream extractor against soup, compare versions up to `STREAM_MAX_VERSION` with `--extractor=stream`:
+    pages it falls back to soup for are counted by reason, so that a run where it is barely used does not pass unnoticed.
+    @Return {era: {'files', 'different', 'time', 'other_time', 'fallbacks'}}
+    '''
+    if options == None:
+        options = default_parse_options()
+    if other_options == None:
+        other_options = default_parse_options()
+        other_options['parser'] = 'lxml'
+    era_results = dict()
+    for i in range(MIN_VERSION, MAX_VERSION+1):
+        version_num = '1.' + str(i) + '.0'
+        doc_source = get_doc_source(version_num, source)
+        crates_string = [crate for crate in get_version_crates(version_num, doc_source) if crate != 'test']
+        era = get_layout_era(i)
+        results = era_results.setdefault(era, {'files': 0, 'different': 0, 'time': 0.0, 'other_time': 0.0, 'fallbacks': 0})
+        for (relative_path, raw_content) in doc_source.iter_html(crates_string, True):
+            html_content = raw_content if options['read_bytes'] else decode_html(raw_content)
+            other_html_content = raw_content if other_options['read_bytes'] else decode_html(raw_content)
+            fallback_count = sum(stream_fallbacks.values())
+            start_time = time.time()
+            result = parse_html(relative_path, i, html_content, options)
+            results['time'] += time.time() - start_time
+            start_time = time.time()
+            other_result = parse_html(relative_path, i, other_html_content, other_options)
+            results['other_time'] += time.time() - start_time
+            results['fallbacks'] += sum(stream_fallbacks.values()) - fallback_count
+            results['files'] += 1
+            differences = diff_parse_results(result, other_result)
+            if len(differences) != 0:
+                results['different'] += 1
+                if results['different'] <= max_printed:
+                    print('Different results', version_num, relative_path)
+                    print(*differences[:10], sep='\n')
+    for (era, results) in era_results.items():
+        print('Era', '{:>6}'.format(era), 'Files', '{:>6}'.format(results['files']), 'Different', '{:>6}'.format(results['different']),
+            'Time', format(results['time'], '.2f'), 'vs', format(results['other_time'], '.2f'), 'Stream fallbacks', results['fallbacks'])
+    if 'stream' in [options['extractor'], other_options['extractor']]:
+        print('Stream fallbacks:', ', '.join(reason + ' ' + str(count) for (reason, count) in sorted(stream_fallbacks.items(), key=lambda item: -item[1])) or 'none')
+    return era_results
+
+
+
+
+
+# Rustdoc html files can be read either from the extracted directory or directly from the downloaded archive.
+# Both doc sources provide `get_crates()` and `iter_html(crates, read_bytes)`, which yields (relative_path, html_content),
+# and `iter_units(crates)` for `parse_html_unit()`.
+# `relative_path` is the path under the html root, e.g. `/std/vec/struct.Vec.html`.
+DOC_PACKAGE = 'rust-docs-nightly-x86_64-unknown-linux-gnu'
+DOC_HTML_ROOT = 'rust-docs/share/doc/rust/html'
+
+
+def get_version_directory(version_num) -> str:
+    return os.getcwd() + '/' + version_num + '/' + DOC_PACKAGE
+
+
+def get_json_file_path(version_num, relative_path) -> str:
+    return get_version_directory(version_num) + '/json_submodule' + relative_path + '.json'
+
+
+class DirectoryDocSource:
+    '''
+    Html files in an extracted rustdoc directory (`<version>/rust-docs-nightly-.../html`).
+    '''
+    def __init__(self, doc_directory):
+        self.doc_directory = doc_directory
+
+    def get_crates(self, browser_fallback = False) -> list:
+        return get_crates(self.doc_directory, browser_fallback)
+
+    def list_html(self, crates) -> list:
+        '''
+        Return relative paths of all html files in `crates`.
+        '''
+        relative_paths = list()
+        for crate in crates:
+            crate_directory = self.doc_directory + '/' + crate
+            for file_name in glob(crate_directory + '/**/*.html', recursive=True):
+                relative_paths.append(file_name[len(self.doc_directory):])
+        return relative_paths
+
+    def get_path(self, relative_path) -> str:
+        return self.doc_directory + relative_path
+
+    def iter_html(self, crates, read_bytes = False):
+        '''
+        Yield (relative_path, html_content) of html files of `crates`. If `read_bytes` is set, html content is not decoded.
+        '''
+        for relative_path in self.list_html(crates):
+            with open(self.get_path(relative_path), 'rb' if read_bytes else 'r') as file:
+                yield (relative_path, file.read())
+
+    def read_search_index_js(self) -> str:
+        '''
+        Return content of `search-index.js` in the html root, or `None` if not found.
+        '''
+        for file_name in sorted(os.listdir(self.doc_directory)):
+            if is_search_index_js(file_name):
+                with open(self.get_path('/' + file_name), 'r') as file:
+                    return file.read()
+        return None
+
+    def iter_files(self, relative_paths):
+        '''
+        Yield (relative_path, content) of files in `relative_paths` which exist.
+        '''
+        for relative_path in sorted(relative_paths):
+            if os.path.isfile(self.get_path(relative_path)):
+                with open(self.get_path(relative_path), 'r') as file:
+                    yield (relative_path, file.read())
+
+    def iter_units(self, crates):
+        '''
+        Yield (relative_path, html_path, None) of html files, largest first, so that big pages do not end up in the tail of a parallel run.
+        Files are read by whoever parses them (see `parse_html_unit()`).
+        '''
+        relative_paths = self.list_html(crates)
+        sizes = dict()
+        for relative_path in relative_paths:
+            sizes[relative_path] = os.path.getsize(self.get_path(relative_path))
+        for relative_path in sorted(relative_paths, key=lambda relative_path: (-sizes[relative_path], relative_path)):
+            yield (relative_path, self.get_path(relative_path), None)
+
+
+class ArchiveDocSource:
+    '''
+    Html files read straight out of a rustdoc archive (`<version>.tar.gz`), without extracting it.
+    The archive is read sequentially in stream mode, so each pass decompresses the archive once.
+    '''
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+
+    def get_relative_path(self, member_name) -> str:
+        '''
+        Return path under the html root of an archive member, or `None` if it is not under the html root.
+        '''
+        root_index = member_name.find('/' + DOC_HTML_ROOT + '/')
+        if root_index == -1:
+            return None
+        return member_name[root_index + len(DOC_HTML_ROOT) + 1:]
+
+    def get_crates(self, browser_fallback = False) -> list:
+        '''
+        Read crates from `crates.js` or `search-index.js` in the html root (see `get_crates_from_static()`).
+        We stop reading the archive once they are found.
+        If not found and `browser_fallback` is set, we extract the files the browser needs
+        (files in the html root and `std/index.html`) into a temporary directory and render it.
+        '''
+        with tempfile.TemporaryDirectory() as doc_directory:
+            with tarfile.open(self.archive_path, 'r|*') as tar:
+                for member in tar:
+                    relative_path = self.get_relative_path(member.name)
+                    if not member.isfile() or relative_path == None:
+                        continue
+                    file_name = relative_path[1:]
+                    if relative_path.count('/') == 1 and (is_crates_js(file_name) or is_search_index_js(file_name)):
+                        crates = read_crates_from_js(file_name, tar.extractfile(member).read().decode('utf-8'))
+                        if crates:
+                            return crates
+                    elif browser_fallback and (relative_path.count('/') == 1 or relative_path == '/std/index.html'):
+                        member.name = file_name
+                        tar.extract(member, doc_directory)
+            if not browser_fallback:
+                raise Exception('Cannot find crates in static files ' + self.archive_path)
+            print('Cannot find crates in static files, fallback to browser', self.archive_path)
+            return get_crates_from_browser(doc_directory)
+
+    def read_search_index_js(self) -> str:
+        '''
+        Return content of `search-index.js` in the html root, or `None` if not found. We stop reading the archive once it is found.
+        '''
+        with tarfile.open(self.archive_path, 'r|*') as tar:
+            for member in tar:
+                relative_path = self.get_relative_path(member.name)
+                if member.isfile() and relative_path != None and relative_path.count('/') == 1 and is_search_index_js(relative_path[1:]):
+                    return tar.extractfile(member).read().decode('utf-8')
+        return None
+
+    def iter_files(self, relative_paths):
+        '''
+        Yield (relative_path, content) of files in `relative_paths` in archive order.
+        '''
+        relative_paths = set(relative_paths)
+        with tarfile.open(self.archive_path, 'r|*') as tar:
+            for member in tar:
+                relative_path = self.get_relative_path(member.name)
+                if member.isfile() and relative_path in relative_paths:
+                    yield (relative_path, tar.extractfile(member).read().decode('utf-8'))
+
+    def iter_html(self, crates, read_bytes = False):
+        '''
+        Yield html files of `crates` in archive order. Other members are skipped without decompressing them to disk.
+        If `read_bytes` is set, html content is not decoded.
+        '''
+        crates = set(crates)
+        with tarfile.open(self.archive_path, 'r|*') as tar:
+            for member in tar:
+                relative_path = self.get_relative_path(member.name)
+                if not member.isfile() or relative_path == None or not relative_path.endswith('.html'):
+                    continue
+                # Same as glob: hidden files are not included.
+                parts = relative_path.split('/')
+                if parts[1] not in crates or any(part.startswith('.') for part in parts):
+                    continue
+                html_content = tar.extractfile(member).read()
+                yield (relative_path, html_content if read_bytes else html_content.decode('utf-8'))
+
+    def iter_units(self, crates):
+        '''
+        Yield (relative_path, None, html_content) in archive order. The archive is streamed, so it cannot be ordered by size.
+        Html content is raw bytes, like files of `DirectoryDocSource` (see `parse_html_unit()`).
+        '''
+        for (relative_path, html_content) in self.iter_html(crates, True):
+            yield (relative_path, None, html_content)
+
+
+def get_doc_source(version_num, source = 'directory'):
+    '''
+    Return the doc source of a version. `source` is either 'directory' (extracted) or 'archive' (`<version>.tar.gz`).
+    '''
+    if source == 'archive':
+        return ArchiveDocSource(os.getcwd() + '/' + version_num + '.tar.gz')
+    return DirectoryDocSource(get_version_directory(version_num) + '/' + DOC_HTML_ROOT)
+
+
+HTML_HEAD_SIZE = 1024
+REFRESH_PATTERN = re.compile(r'http-equiv=["\']?refresh', re.IGNORECASE)
+
+
+def classify_html(relative_path, head) -> str:
+    '''
+    Decide from the path and the head of a page (first `HTML_HEAD_SIZE` bytes or characters) if it is worth parsing.
+    Return the reason to skip it, or `None` if it should be parsed.
+    We only skip pages `parse_html()` would return `None` for, so skipping never changes the output:
+    1. 'all': `all.html` (see `parse_html()`).
+    2. 'source': source code pages (`/src/...`).
+    3. 'primitive', 'keyword': they have no api, so no kind (see `parse_html_inband()`).
+    4. 'redirect' and 'empty': the whole page is in the head, and there is no `in-band` span.
+    Redirect pages (`<meta http-equiv="refresh">`) are left for moved or re-exported items.
+    '''
+    if 'all.html' in relative_path:
+        return 'all'
+    if relative_path.split('/')[1] == 'src':
+        return 'source'
+    file_name = os.path.basename(relative_path)
+    if file_name.startswith('primitive.'):
+        return 'primitive'
+    if file_name.startswith('keyword.'):
+        return 'keyword'
+    # The length is compared before decoding: a head of bytes with multibyte characters is shorter once decoded.
+    if len(head) >= HTML_HEAD_SIZE:
+        return None
+    if isinstance(head, bytes):
+        head = head.decode('utf-8', 'replace')
+    if 'in-band' not in head:
+        if REFRESH_PATTERN.search(head):
+            return 'redirect'
+        return 'empty'
+    return None
+
+
+# Parse cache. Most pages barely change between releases, so results are cached by normalized content and layout era.
+PARSE_CACHE_FILE = 'parse_cache.sqlite'
+# Functions results of each era depend on: (first version, functions). Eras include functions of all entries before them.
+# Changing one of them only invalidates cached results of eras that use it.
+PARSE_FUNCTIONS = [
+    (1, ['parse_html', 'get_layout_plan', 'get_layout_version', 'parse_html_inband', 'get_pres', 'get_stability', 'get_api', 'parse_html_h2items', 'parse_html_div_items',
+        'process_fileds', 'parse_html_spanitems', 'get_unstable_count', 'is_unstable', 'empty_function', 'empty_impl',
+        'empty_item', 'empty_submodule', 'make_soup']),
+    (21, ['is_h3h4_collapsed', 'parse_h3h4_indiv']),
+    (38, ['is_fields_indiv', 'parse_fields_indiv']),
+    (52, ['parse_html_h2items_details', 'is_details_collapsed', 'parse_html_detail_impl_items', 'parse_single_detail_function']),
+]
+SCOPED_PARSE_FUNCTIONS = ['ScopedSoup', 'is_skipped_docblock']
+STREAM_PARSE_FUNCTIONS = ['StreamExtractor', 'StreamRecord', 'get_record_class', 'find_record', 'get_record_stability',
+    'get_record_api', 'get_record_code', 'parse_stream_div_items', 'parse_stream_fields_indiv', 'parse_stream_spanitems',
+    'process_stream_fields', 'is_stream_h3h4_collapsed', 'parse_stream_h3h4_indiv', 'parse_stream_h2items', 'parse_html_stream']
+# Only attribute values are normalized. Text may be extracted (e.g. 'Deprecated since 1.52.0'), so it is hashed as is.
+ATTRIBUTE_VALUE_PATTERN = re.compile(r'=\s*(?:"[^"]*"|\'[^\']*\')')
+ASSET_PATTERNS = [
+    (re.compile(r'-[0-9a-f]{8,}\b'), '-HASH'), # static.files/main-5d4f3b2e1a0c9b8d.js
+    (re.compile(r'gotosrc=\d+'), 'gotosrc=N'), # old source links
+    (re.compile(r'\bsrc-\d+'), 'src-N'),
+    (re.compile(r'\.rs\.html#L?\d+(-L?\d+)?'), '.rs.html#N'), # line numbers of source links
+]
+era_fingerprints = dict()
+parse_cache_connections = dict()
+
+
+def get_era_fingerprint(version_num, options) -> str:
+    '''
+    Hash of the era, parse options and source of the functions results of the era depend on (see `PARSE_FUNCTIONS`).
+    '''
+    use_stream = options['extractor'] == 'stream' and version_num <= STREAM_MAX_VERSION
+    key = (get_layout_era(version_num), options['parser'], options['scoped'], use_stream)
+    if key not in era_fingerprints:
+        function_names = list()
+        for (first_version, names) in PARSE_FUNCTIONS:
+            if version_num >= first_version:
+                function_names += names
+        if options['scoped']:
+            function_names += SCOPED_PARSE_FUNCTIONS
+        if use_stream:
+            function_names += STREAM_PARSE_FUNCTIONS
+        fingerprint = hashlib.sha256(repr(key).encode('utf-8'))
+        fingerprint.update(repr(api_mappings).encode('utf-8'))
+        fingerprint.update(repr(LAYOUT_FEATURES).encode('utf-8'))
+        for name in function_names:
+            fingerprint.update(inspect.getsource(globals()[name]).encode('utf-8'))
+        era_fingerprints[key] = fingerprint.hexdigest()
+    return era_fingerprints[key]
+
+
+def normalize_html(html_content, version_num) -> str:
+    '''
+    Remove what changes between releases without changing the page: the version string (e.g. `main1.52.0.js`,
+    `data-resource-suffix="1.52.0"`), asset hashes and source line numbers. Only attribute values are changed.
+    '''
+    if isinstance(html_content, bytes):
+        html_content = html_content.decode('utf-8', 'replace')
+    version_string = '1.' + str(version_num) + '.0'
+    def normalize_value(match):
+        value = match.group(0).replace(version_string, 'VERSION')
+        for (pattern, replacement) in ASSET_PATTERNS:
+            value = pattern.sub(replacement, value)
+        return value
+    return ATTRIBUTE_VALUE_PATTERN.sub(normalize_value, html_content)
+
+
+def get_cache_key(relative_path, version_num, html_content, options) -> str:
+    '''
+    Pages with the same key give the same `parse_html()` result: same normalized content, era fingerprint and page type.
+    '''
+    key = hashlib.sha256(get_era_fingerprint(version_num, options).encode('utf-8'))
+    key.update(b'module' if '/index.html' in relative_path else b'item')
+    key.update(normalize_html(html_content, version_num).encode('utf-8'))
+    return key.hexdigest()
+
+
+def get_parse_cache(cache_path):
+    '''
+    Return the sqlite connection of the parse cache. Each process opens its own connection.
+    '''
+    key = (cache_path, os.getpid())
+    if key not in parse_cache_connections:
+        connection = sqlite3.connect(cache_path, timeout = 60)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS parse_cache (key TEXT PRIMARY KEY, result TEXT)')
+        parse_cache_connections[key] = connection
+    return parse_cache_connections[key]
+
+
+def get_cached_parse(cache_path, cache_key):
+    '''
+    Return (found, tuples), where `tuples` is the cached return value of `parse_html()`.
+    '''
+    row = get_parse_cache(cache_path).execute('SELECT result FROM parse_cache WHERE key = ?', (cache_key,)).fetchone()
+    if row == None:
+        return (False, None)
+    tuples = json.loads(row[0])
+    return (True, tuple(tuples) if tuples != None else None)
+
+
+def set_cached_parse(cache_path, cache_key, tuples):
+    get_parse_cache(cache_path).execute('INSERT OR REPLACE INTO parse_cache VALUES (?, ?)', (cache_key, json.dumps(tuples)))
+
+
+# Re-exports. `std` re-renders most pages of `core` and `alloc`, which differ only in crate names and links.
+TAG_PATTERN = re.compile(r'<[a-zA-Z][^>]*>')
+TAG_ATTRIBUTE_PATTERN = re.compile(r'(\s[\w:.-]+)\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\'>]+)')
+
+
+def get_alias_key(relative_path, html_content):
+    '''
+    Pages with the same alias key render the same item in different crates (e.g. `/alloc/vec/struct.Vec.html` and
+    `/std/vec/struct.Vec.html`). Their `parse_html()` results only differ in crate names.
+    The key is the path within the crate and the hash of the page where:
+    1. Attribute values are blanked (links point to the crate), except `class` and `id` which are parsed.
+    2. The crate name (as a whole word) is replaced by a placeholder.
+    '''
+    (_, crate, crate_path) = relative_path.split('/', 2)
+    if isinstance(html_content, bytes):
+        html_content = html_content.decode('utf-8', 'replace')
+    def blank_attributes(match):
+        return TAG_ATTRIBUTE_PATTERN.sub(lambda attribute: attribute.group(0) if attribute.group(1).strip() in ['class', 'id'] else attribute.group(1) + '=""', match.group(0))
+    normalized = TAG_PATTERN.sub(blank_attributes, html_content)
+    normalized = re.sub(r'\b' + re.escape(crate) + r'\b', '\x00', normalized)
+    return (crate_path, hashlib.sha256(normalized.encode('utf-8')).hexdigest())
+
+
+def dedupe_units(units, aliases):
+    '''
+    Drop units of re-exported pages. The first page with an alias key (see `get_alias_key()`) is parsed,
+    later ones are added to `aliases` (relative_path -> relative_path of the parsed page).
+    Html files are read here, as we need their content.
+    '''
+    parsed_paths = dict()
+    for unit in units:
+        (relative_path, version_num, html_path, html_content, options) = unit
+        if html_content == None:
+            with open(html_path, 'rb') as file:
+                html_content = file.read()
+        alias_key = get_alias_key(relative_path, html_content)
+        if alias_key in parsed_paths:
+            aliases[relative_path] = parsed_paths[alias_key]
+            continue
+        parsed_paths[alias_key] = relative_path
+        yield (relative_path, version_num, html_path, html_content, options)
+
+
+def get_alias_record(relative_path, alias_of) -> dict:
+    '''
+    Json record stored for a re-exported page instead of its submodule.
+    Its submodule is the submodule of `alias_of` with `from_crate` replaced by `to_crate` (see `rename_crate()` in analysis.py).
+    '''
+    return {
+        'alias_of': alias_of,
+        'from_crate': alias_of.split('/')[1],
+        'to_crate': relative_path.split('/')[1],
+    }
+
+
+def write_json_file(json_file_path, data):
+    # Write then rename, so an interrupted run never leaves a cut json file.
+    os.makedirs(os.path.dirname(json_file_path), exist_ok=True)
+    with open(json_file_path + '.partial', 'w+') as file:
+        json.dump(data, file)
+    os.replace(json_file_path + '.partial', json_file_path)
+
+
+def store_submodule(version_num, relative_path, data, shard_writer = None):
+    '''
+    Store the submodule (or alias record) of a page, in the version shard if `shard_writer` is given, otherwise in its own json file.
+    '''
+    if shard_writer != None:
+        shard_writer.write(relative_path, data)
+    else:
+        write_json_file(get_json_file_path(version_num, relative_path), data)
+
+
+# Manifest of a version: what each html file gave in the last run, to only re-parse changed files (`--incremental`).
+MANIFEST_FILE_NAME = 'manifest.json'
+
+
+def get_source_hash(html_content) -> str:
+    '''
+    Hash of the raw bytes of a html file. Doc sources give html as bytes (see `parse_html_unit()`), so the hash does not
+    depend on `--read_bytes`.
+    '''
+    if isinstance(html_content, str):
+        html_content = html_content.encode('utf-8')
+    return hashlib.sha256(html_content).hexdigest()
+
+
+def decode_html(html_content) -> str:
+    '''
+    Decode raw html the way `open()` in text mode reads it (utf-8, universal newlines).
+    '''
+    return html_content.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def get_manifest_path(version_num) -> str:
+    return get_version_directory(version_num) + '/' + MANIFEST_FILE_NAME
+
+
+def load_manifest(version_num) -> dict:
+    '''
+    Return the manifest of the last run of a version, or `None` if there is none:
+    {
+        'fingerprint': era fingerprint of the parser (see `get_era_fingerprint()`),
+        'output': 'json' or 'shard',
+        'files': relative_path -> {
+            'hash': sha256 of the html (`None` if skipped before reading it),
+            'skip': skip reason (see `parse_html_unit()`), 'alias_of': parsed page of aliases,
+            'counts': unstable counts (`None` if no submodule), 'output': output file under the version directory,
+        }
+    }
+    '''
+    manifest_path = get_manifest_path(version_num)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as file:
+        return json.load(file)
+
+
+def save_manifest(version_num, manifest):
+    # Write then rename, so an interrupted run keeps the last complete manifest.
+    manifest_path = get_manifest_path(version_num)
+    with open(manifest_path + '.partial', 'w') as file:
+        json.dump(manifest, file)
+    os.replace(manifest_path + '.partial', manifest_path)
+
+
+def get_output_location(version_num, relative_path, shard_writer = None) -> str:
+    '''
+    File `store_submodule()` stores the submodule in, relative to the version directory.
+    '''
+    if shard_writer != None:
+        return os.path.basename(shard_writer.shard_path)
+    return os.path.relpath(get_json_file_path(version_num, relative_path), get_version_directory(version_num))
+
+
+def remove_stale_outputs(version_num, previous_manifest, files):
+    '''
+    Remove json files the last run (`previous_manifest`) wrote for html files which now have no output in `files`:
+    pages which gave no submodule this time, and pages deleted since (or not parsed by this run, e.g. out of the inventory).
+    Otherwise they would be read as results of this run. Shards are written whole by each run, so they have no stale records.
+    '''
+    if previous_manifest == None or previous_manifest['output'] != 'json':
+        return
+    for (relative_path, entry) in previous_manifest['files'].items():
+        if entry['output'] == None or files.get(relative_path, dict()).get('output') != None:
+            continue
+        previous_output_path = get_version_directory(version_num) + '/' + entry['output']
+        if os.path.exists(previous_output_path):
+            os.remove(previous_output_path)
+
+
+def skip_unchanged_units(units, reusable_files, reused_files):
+    '''
+    Drop units whose html has the same hash as in `reusable_files` (from the manifest). Their entries are added to `reused_files`.
+    Html files are hashed here, changed ones are read again by whoever parses them.
+    '''
+    for unit in units:
+        (relative_path, version_num, html_path, html_content, options) = unit
+        if relative_path not in reusable_files:
+            yield unit
+            continue
+        if html_content == None:
+            with open(html_path, 'rb') as file:
+                source_hash = get_source_hash(file.read())
+        else:
+            source_hash = get_source_hash(html_content)
+        if source_hash == reusable_files[relative_path]['hash']:
+            reused_files[relative_path] = reusable_files[relative_path]
+            continue
+        yield unit
+
+
+PARSE_TASKS_PER_CHILD = 500
+# Budget of parsing one html file. Pages over it are quarantined (see `parse_with_budget()`) rather than stalling the run.
+PARSE_TIMEOUT = 300 # Seconds.
+PARSE_MEMORY = 4 * 2**30 # Bytes of address space parsing a page may grow the process by.
+QUARANTINE_FILE = 'quarantine.jsonl'
+
+
+class ParseTimeout(BaseException):
+    '''
+    Raised by SIGALRM when a page is over the time budget. Not an `Exception`, so that parse functions cannot catch it.
+    '''
+    pass
+
+
+def raise_parse_timeout(signum, frame):
+    raise ParseTimeout()
+
+
+def set_memory_budget(memory_budget) -> int:
+    '''
+    Cap the address space of the process at its current size plus `memory_budget`, so that a page building a huge tree
+    fails with `MemoryError` rather than exhausting the host. Set before parsing each page, so the budget is per page.
+    The limit is process-wide: only one thread of a process should parse at a time (as in pipeline.py).
+    @Return the previous limit, to give back to `reset_memory_budget()`.
+    '''
+    with open('/proc/self/statm', 'r') as file:
+        size = int(file.read().split()[0]) * resource.getpagesize()
+    (previous_limit, hard_limit) = resource.getrlimit(resource.RLIMIT_AS)
+    limit = size + memory_budget if hard_limit == resource.RLIM_INFINITY else min(size + memory_budget, hard_limit)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard_limit))
+    return previous_limit
+
+
+def reset_memory_budget(previous_limit):
+    resource.setrlimit(resource.RLIMIT_AS, (previous_limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+
+
+def parse_with_budget(relative_path, version_num, html_content, options):
+    '''
+    Run `parse_html()` within the time budget `options['timeout']` (seconds, `None` for no limit)
+    and the memory budget `options['memory']` (bytes, see `set_memory_budget()`).
+    @Return (tuples, quarantine). If parsing is over the time or memory budget, or recurses too deep (e.g. recursive type
+    definitions, see the notes at the end), `tuples` is `None` and `quarantine` is {'reason', 'detail'}.
+    Under a memory budget, C extensions (lxml) that fail to allocate may raise `SystemError` instead of `MemoryError`:
+    it is then quarantined as 'memory' too. Other errors are parser bugs: they are raised, as without a budget.
+    The timer needs signals, which only the main thread gets: parsing in other threads has no time budget.
+    '''
+    use_timer = options['timeout'] != None and threading.current_thread() is threading.main_thread()
+    if use_timer:
+        previous_handler = signal.signal(signal.SIGALRM, raise_parse_timeout)
+    previous_memory_limit = set_memory_budget(options['memory']) if options['memory'] != None else None
+    try:
+        if use_timer:
+            signal.setitimer(signal.ITIMER_REAL, options['timeout'])
+        return (parse_html(relative_path, version_num, html_content, options), None)
+    except ParseTimeout:
+        return (None, {'reason': 'timeout', 'detail': 'over ' + str(options['timeout']) + ' s'})
+    except MemoryError:
+        return (None, {'reason': 'memory', 'detail': 'over ' + str(options['memory']) + ' bytes'})
+    except SystemError as e:
+        if previous_memory_limit == None:
+            raise
+        return (None, {'reason': 'memory', 'detail': 'over ' + str(options['memory']) + ' bytes: ' + str(e)})
+    except RecursionError as e:
+        return (None, {'reason': 'recursion', 'detail': str(e)})
+    finally:
+        if use_timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+        if previous_memory_limit != None:
+            reset_memory_budget(previous_memory_limit)
+
+
+def parse_html_unit(unit):
+    '''
+    Parse one html file. This is the work unit of `parse_all_docs()`, which may run in worker processes.
+    @Input (relative_path, version_num, html_path, html_content, options). Either `html_path` or `html_content` is given.
+    @Return (relative_path, tuples, skip_reason, cache_key, source_hash, quarantine), where `tuples` is the return value of `parse_html()`.
+    If `options['classify']` is set, pages are first classified by `classify_html()`. Skipped pages are not read further,
+    so they have no `source_hash`.
+    If `options['cache']` is set, cached results are returned without parsing (`skip_reason` is 'cached').
+    Otherwise `cache_key` is given, and the caller stores the result: worker processes only read the cache.
+    Pages over the parse budget (see `parse_with_budget()`) are skipped as 'quarantined', with `quarantine` telling why.
+    They have no `source_hash` or `cache_key`, so they are parsed again by the next run.
+    Html is read as bytes, hashed, then decoded unless `options['read_bytes']` is set.
+    '''
+    (relative_path, version_num, html_path, html_content, options) = unit
+    if html_content == None:
+        with open(html_path, 'rb') as file:
+            head = file.read(HTML_HEAD_SIZE)
+            skip_reason = classify_html(relative_path, head) if options['classify'] else None
+            if skip_reason != None:
+                return (relative_path, None, skip_reason, None, None, None)
+            html_content = head + file.read()
+    elif options['classify']:
+        skip_reason = classify_html(relative_path, html_content[:HTML_HEAD_SIZE])
+        if skip_reason != None:
+            return (relative_path, None, skip_reason, None, None, None)
+    source_hash = get_source_hash(html_content)
+    if isinstance(html_content, bytes) and not options['read_bytes']:
+        html_content = decode_html(html_content)
+    cache_key = None
+    if options['cache'] != None:
+        cache_key = get_cache_key(relative_path, version_num, html_content, options)
+        (found, tuples) = get_cached_parse(options['cache'], cache_key)
+        if found:
+            return (relative_path, tuples, 'cached', None, source_hash, None)
+    (tuples, quarantine) = parse_with_budget(relative_path, version_num, html_content, options)
+    if quarantine != None:
+        return (relative_path, None, 'quarantined', None, None, quarantine)
+    return (relative_path, tuples, None, cache_key, source_hash, None)
+
+
+def map_units(function, units, workers = 1, tasks_per_child = PARSE_TASKS_PER_CHILD):
+    '''
+    Apply `function` to all `units`. Results are yielded in the order of `units` whatever the number of workers,
+    so that outputs written in this order (e.g. shards) do not depend on it.
+    If `workers` > 1, units are spread across worker processes, which are replaced after `tasks_per_child` units to cap memory.
+    '''
+    if workers <= 1:
+        for unit in units:
+            yield function(unit)
+        return
+    with multiprocessing.Pool(workers, maxtasksperchild=tasks_per_child) as pool:
+        for result in pool.imap(function, units):
+            yield result
+
+
+def get_quarantine_entry(version_num, relative_path, quarantine) -> dict:
+    return {'version': version_num, 'file': relative_path, 'reason': quarantine['reason'], 'detail': quarantine['detail'], 'time': time.time()}
+
+
+def record_quarantine(quarantine_path, version_num, relative_path, quarantine):
+    print('Quarantined ' + version_num + relative_path + ':', quarantine['reason'], quarantine['detail'])
+    with open(quarantine_path, 'a') as file:
+        file.write(json.dumps(get_quarantine_entry(version_num, relative_path, quarantine)) + '\n')
+
+
+def is_quarantine_cleared(entry, manifests) -> bool:
+    '''
+    Tell if the page of a quarantine entry was parsed by a run which saved the manifest of its version after the page was quarantined.
+    `manifests` caches version_num -> (manifest, time it was saved).
+    '''
+    version_num = entry['version']
+    if version_num not in manifests:
+        manifest_path = get_manifest_path(version_num)
+        manifests[version_num] = (load_manifest(version_num), os.path.getmtime(manifest_path)) if os.path.exists(manifest_path) else (None, 0)
+    (manifest, manifest_time) = manifests[version_num]
+    if manifest == None or manifest_time <= entry.get('time', 0):
+        return False
+    file_entry = manifest['files'].get(entry['file'])
+    return file_entry != None and file_entry['skip'] != 'quarantined'
+
+
+def load_quarantine(quarantine_path = QUARANTINE_FILE) -> dict:
+    '''
+    Return (version_num, relative_path) -> last quarantine entry of the file, for pages still quarantined:
+    pages a later run parsed are dropped (see `is_quarantine_cleared()`).
+    '''
+    entries = dict()
+    if not os.path.exists(quarantine_path):
+        return entries
+    with open(quarantine_path, 'r') as file:
+        for line in file:
+            entry = json.loads(line)
+            entries[(entry['version'], entry['file'])] = entry
+    manifests = dict()
+    return {key: entry for (key, entry) in entries.items() if not is_quarantine_cleared(entry, manifests)}
+
+
+def save_quarantine(quarantine_path, entries):
+    '''
+    Rewrite the quarantine with `entries` only. Workers append to it, so only call it when no parse run is using it.
+    '''
+    with open(quarantine_path + '.partial', 'w') as file:
+        for entry in entries:
+            file.write(json.dumps(entry) + '\n')
+    os.replace(quarantine_path + '.partial', quarantine_path)
+
+
+# Journal of a parse run, to resume it where it stopped (`--journal`).
+PARSE_JOURNAL_FILE = 'parse_journal.jsonl'
+JOURNAL_COMMIT_UNITS = 200
+
+
+class ParseJournal:
+    '''
+    Append-only journal of parsed (version, file) units. Each line is a json entry:
+    1. {'version', 'start', 'fingerprint', 'output'}: a version is (re)started. Earlier entries of the version are dropped.
+    2. {'version', 'file', 'entry'}: a file is parsed and its output is written. `entry` is its manifest entry (see `load_manifest()`).
+    3. {'version', 'commit', 'shard'}: file entries before it are on disk. `shard` is the offsets of the version shard at that time.
+    4. {'version', 'done', 'totals', 'skip_counts'}: a version is complete.
+    Lines are written in batches, each ending with a commit line, followed by fsync. Entries after the last commit are not trusted.
+    '''
+    def __init__(self, journal_path = PARSE_JOURNAL_FILE):
+        self.journal_path = journal_path
+        self.versions = self.load()
+        self.pending_lines = list()
+        self.file = open(journal_path, 'a')
+        if self.file.tell() > 0:
+            with open(journal_path, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    self.file.write('\n') # The last line was cut by an interrupted run.
+
+    def load(self) -> dict:
+        '''
+        Return version -> {'fingerprint', 'output', 'files': committed entries, 'shard': offsets at last commit, 'done': done entry}.
+        '''
+        versions = dict()
+        pending_files = dict()
+        if not os.path.exists(self.journal_path):
+            return versions
+        with open(self.journal_path, 'r') as file:
+            for line in file:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # Line cut by an interrupted run.
+                version_num = item['version']
+                if 'start' in item:
+                    versions[version_num] = {'fingerprint': item['fingerprint'], 'output': item['output'], 'files': dict(), 'shard': None, 'done': None}
+                    pending_files[version_num] = dict()
+                elif version_num not in versions:
+                    continue
+                elif 'file' in item:
+                    pending_files[version_num][item['file']] = item['entry']
+                elif 'commit' in item:
+                    versions[version_num]['files'].update(pending_files[version_num])
+                    if item['shard'] != None:
+                        versions[version_num]['shard'] = item['shard']
+                    pending_files[version_num] = dict()
+                elif 'done' in item:
+                    versions[version_num]['done'] = item
+        return versions
+
+    def get_version(self, version_num, fingerprint, output) -> dict:
+        '''
+        Return what the journal has of a version (see `load()`), or `None` if it was parsed with another parser or output.
+        '''
+        version = self.versions.get(version_num)
+        if version == None or version['fingerprint'] != fingerprint or version['output'] != output:
+            return None
+        return version
+
+    def write_line(self, item):
+        self.pending_lines.append(json.dumps(item) + '\n')
+
+    def start_version(self, version_num, fingerprint, output):
+        self.write_line({'version': version_num, 'start': True, 'fingerprint': fingerprint, 'output': output})
+        self.commit(version_num)
+
+    def record_file(self, version_num, relative_path, entry):
+        self.write_line({'version': version_num, 'file': relative_path, 'entry': entry})
+
+    def commit(self, version_num, shard_offsets = None):
+        self.write_line({'version': version_num, 'commit': True, 'shard': shard_offsets})
+        self.file.write(''.join(self.pending_lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending_lines = list()
+
+    def finish_version(self, version_num, totals, skip_counts):
+        self.write_line({'version': version_num, 'done': True, 'totals': totals, 'skip_counts': skip_counts})
+        self.commit(version_num)
+
+    def close(self):
+        self.file.close()
+
+
+def print_version_totals(version_num, total_unstable_collected, total_unstable_exist, skip_counts, file = None):
+    print(version_num, total_unstable_collected, total_unstable_exist, file=file)
+    # Keep the version out of this line, `results.py` greps lines by version.
+    print('Skipped pages:', ', '.join(reason + ' ' + str(count) for (reason, count) in sorted(skip_counts.items())), file=file)
+
+
+def print_journal_totals(journal_path = PARSE_JOURNAL_FILE):
+    '''
+    Print per-version unstable totals of complete versions in the journal, the same way `parse_all_docs()` prints them.
+    '''
+    versions = ParseJournal(journal_path).versions
+    for version_num in sorted(versions, key=lambda version_num: int(version_num.split('.')[1])):
+        done = versions[version_num]['done']
+        if done != None:
+            print_version_totals(version_num, done['totals'][0], done['totals'][1], done['skip_counts'])
+
+
+def get_parse_crates(i, doc_source, browser_fallback = False) -> list:
+    '''
+    Return crates of version `1.i.0` whose html files we parse.
+    '''
+    version_num = '1.' + str(i) + '.0'
+    # Find root html: std/index.html
+    if i == 52: # This is exception
+        crates_string = ['alloc', 'core', 'proc_macro', 'std']
+    else:
+        crates_string = get_version_crates(version_num, doc_source, browser_fallback)
+    return [crate for crate in crates_string if crate != 'test']
+
+
+def parse_all_docs(MIN_VERSION = 1, MAX_VERSION = 63, source = 'directory', browser_fallback = False, workers = 1, options = None, output = 'json', incremental = False, journal_path = None):
+    '''
+    Parse all rustdocs to get items data in different compiler versions.
+    These data are actually Abstract Resource Tree. Through analysing AST, we can know API evolution, especially unstable API.
+    @Algorithm:
+    1. We first parse root doc and call `get_crates()` to get all standard library crates, which we will then parse them.
+    2. We call `parse_html()` to parse all html files, which contain AST of all data (e.g. modules, primitives, functions, structs).
+    Html files are read from `source`, see `get_doc_source()`.
+    Crates are read from static files. Set `browser_fallback` to render `std/index.html` if they are not recognized.
+    Html files are parsed by `workers` processes. The output does not depend on the number of workers:
+    each json file only depends on its html file, and the unstable counts are sums.
+    `options` selects how html files are parsed, see `default_parse_options()`.
+    Set `options['cache']` to reuse results of unchanged pages from earlier runs and other versions (see `get_cache_key()`).
+    Set `options['dedupe']` to parse re-exported pages once. Their json files are alias records (see `get_alias_record()`).
+    `output` is either 'json' (a json file per html under `json_submodule/`) or 'shard' (one packed file per version, see shard.py).
+    Each run writes a manifest per version (see `load_manifest()`). Set `incremental` to keep the output of html files
+    which did not change since the last run, if the parser of their era did not change either.
+    Set `journal_path` to record parsed files in a journal (see `ParseJournal`). Running again with the same journal resumes
+    where the last run stopped: complete versions only print their totals, and parsed files of other versions are kept.
+    '''
+    if options == None:
+        options = default_parse_options()
+    journal = ParseJournal(journal_path) if journal_path != None else None
+    for i in range(MIN_VERSION, MAX_VERSION+1):
+        parse_version_docs(i, source, browser_fallback, workers, options, output, incremental, journal)
+    if journal != None:
+        journal.close()
+    # Drop entries of pages parsed since they were quarantined.
+    if os.path.exists(options['quarantine']):
+        save_quarantine(options['quarantine'], load_quarantine(options['quarantine']).values())
+
+
+def parse_version_docs(i, source = 'directory', browser_fallback = False, workers = 1, options = None, output = 'json', incremental = False, journal = None):
+    '''
+    Parse all html files of version `1.i.0`, see `parse_all_docs()`.
+    @Return (total_unstable_collected, total_unstable_exist, skip_counts) of the version.
+    '''
+    if options == None:
+        options = default_parse_options()
+    version_num = '1.' + str(i) + '.0'
+    fingerprint = get_era_fingerprint(i, options)
+    # Files already parsed by an interrupted run with the same journal.
+    journal_version = journal.get_version(version_num, fingerprint, output) if journal != None else None
+    if journal_version != None and journal_version['done'] != None:
+        done = journal_version['done']
+        print_version_totals(version_num, done['totals'][0], done['totals'][1], done['skip_counts'])
+        return (done['totals'][0], done['totals'][1], done['skip_counts'])
+    resumed_files = journal_version['files'] if journal_version != None else dict()
+    if journal != None and len(resumed_files) == 0:
+        journal.start_version(version_num, fingerprint, output)
+    doc_source = get_doc_source(version_num, source)
+    crates_string = get_parse_crates(i, doc_source, browser_fallback)
+
+    # Files of the last run we can keep: same parser, same kind of output, and the output is still there.
+    previous_manifest = load_manifest(version_num)
+    previous_files = previous_manifest['files'] if previous_manifest != None else dict()
+    shard_path = get_shard_path(get_version_directory(version_num))
+    previous_shard_path = os.path.dirname(shard_path) + '/previous-' + os.path.basename(shard_path)
+    previous_shard = None
+    reusable_files = dict()
+    if incremental and previous_manifest != None and previous_manifest['fingerprint'] == fingerprint and previous_manifest['output'] == output:
+        if output == 'shard':
+            # Keep the last shard until this run is complete. If the last run was interrupted, its previous shard is still the last complete one.
+            if not os.path.exists(previous_shard_path) and os.path.exists(shard_path):
+                move_shard(shard_path, previous_shard_path)
+            if os.path.exists(previous_shard_path):
+                previous_shard = ShardReader(previous_shard_path)
+        for (relative_path, entry) in previous_files.items():
+            if entry['hash'] == None or entry.get('alias_of') != None:
+                continue
+            if entry['output'] != None:
+                if output == 'shard' and (previous_shard == None or relative_path not in previous_shard):
+                    continue
+                if output == 'json' and not os.path.exists(get_version_directory(version_num) + '/' + entry['output']):
+                    continue
+            reusable_files[relative_path] = entry
+
+    # Find all html
+    total_unstable_collected = 0
+    total_unstable_exist = 0
+    skip_counts = dict() # reason -> count, see `classify_html()`
+    files = dict() # -> manifest entries
+    units = ((relative_path, i, html_path, html_content, options) for (relative_path, html_path, html_content) in doc_source.iter_units(crates_string))
+    aliases = dict() # relative_path -> relative_path of the parsed page, see `dedupe_units()`
+    parsed_counts = dict() # relative_path -> unstable counts, for aliases
+    reused_files = dict() # relative_path -> manifest entry, see `skip_unchanged_units()`
+    if options['inventory']:
+        inventory = load_inventory(version_num)
+        if inventory == None:
+            inventory = build_inventory(i, source, browser_fallback)
+        inventory_pages = get_inventory_pages(inventory)
+        units = (unit for unit in units if unit[0] in inventory_pages)
+    if options['dedupe']:
+        units = dedupe_units(units, aliases)
+    if len(resumed_files) != 0:
+        units = (unit for unit in units if unit[0] not in resumed_files)
+    if len(reusable_files) != 0:
+        units = skip_unchanged_units(units, reusable_files, reused_files)
+    if len(resumed_files) != 0 and output == 'shard':
+        # Continue the shard of the interrupted run, without records it wrote after its last commit.
+        truncate_shard(shard_path, journal_version['shard'])
+        shard_writer = ShardWriter(shard_path, 'a')
+    else:
+        # A stale shard would be read instead of json files, and a new shard replaces the old one.
+        remove_shard(shard_path)
+        shard_writer = ShardWriter(shard_path) if output == 'shard' else None
+    for (relative_path, entry) in resumed_files.items():
+        files[relative_path] = entry
+        if entry['skip'] != None:
+            skip_counts[entry['skip']] = skip_counts.get(entry['skip'], 0) + 1
+        if entry['counts'] != None:
+            total_unstable_collected += entry['counts'][0]
+            total_unstable_exist += entry['counts'][1]
+            parsed_counts[relative_path] = tuple(entry['counts'])
+    uncommitted_count = 0
+    for (relative_path, tuples, skip_reason, cache_key, source_hash, quarantine) in map_units(parse_html_unit, units, workers):
+        if quarantine != None:
+            record_quarantine(options['quarantine'], version_num, relative_path, quarantine)
+        if skip_reason != None:
+            skip_counts[skip_reason] = skip_counts.get(skip_reason, 0) + 1
+        if cache_key != None:
+            set_cached_parse(options['cache'], cache_key, tuples)
+        files[relative_path] = {'hash': source_hash, 'skip': skip_reason, 'counts': None, 'output': None}
+        if tuples != None:
+            (submodule, collected_unstable_count, html_unstable_count) = tuples
+            total_unstable_collected += collected_unstable_count
+            total_unstable_exist += html_unstable_count
+            parsed_counts[relative_path] = (collected_unstable_count, html_unstable_count)
+            # Store submodule data into json
+            store_submodule(version_num, relative_path, submodule, shard_writer)
+            files[relative_path]['counts'] = [collected_unstable_count, html_unstable_count]
+            files[relative_path]['output'] = get_output_location(version_num, relative_path, shard_writer)
+        # test_div_types(file_name)
+        # test_stab_items(file_name)
+        # print(stab_set)
+        # print(stab_set)
+        if journal != None:
+            # The output of this file is written, it is kept by a resumed run after the next commit.
+            journal.record_file(version_num, relative_path, files[relative_path])
+            uncommitted_count += 1
+            if uncommitted_count >= JOURNAL_COMMIT_UNITS:
+                journal.commit(version_num, shard_writer.flush() if shard_writer != None else None)
+                uncommitted_count = 0
+    if journal != None and uncommitted_count > 0:
+        journal.commit(version_num, shard_writer.flush() if shard_writer != None else None)
+    # Unchanged files keep their output and counts.
+    for (relative_path, entry) in sorted(reused_files.items()):
+        skip_counts['unchanged'] = skip_counts.get('unchanged', 0) + 1
+        files[relative_path] = entry
+        if entry['counts'] == None:
+            continue
+        (collected_unstable_count, html_unstable_count) = entry['counts']
+        total_unstable_collected += collected_unstable_count
+        total_unstable_exist += html_unstable_count
+        parsed_counts[relative_path] = (collected_unstable_count, html_unstable_count)
+        if shard_writer != None:
+            shard_writer.write(relative_path, previous_shard.get(relative_path))
+    # Aliases share the result of the parsed page. Their counts are the same, as only crate names differ.
+    for (relative_path, alias_of) in sorted(aliases.items()):
+        skip_counts['alias'] = skip_counts.get('alias', 0) + 1
+        files[relative_path] = {'hash': None, 'skip': 'alias', 'alias_of': alias_of, 'counts': None, 'output': None}
+        if alias_of not in parsed_counts:
+            continue
+        (collected_unstable_count, html_unstable_count) = parsed_counts[alias_of]
+        total_unstable_collected += collected_unstable_count
+        total_unstable_exist += html_unstable_count
+        store_submodule(version_num, relative_path, get_alias_record(relative_path, alias_of), shard_writer)
+        files[relative_path]['counts'] = [collected_unstable_count, html_unstable_count]
+        files[relative_path]['output'] = get_output_location(version_num, relative_path, shard_writer)
+    if shard_writer != None:
+        shard_writer.close()
+    if options['cache'] != None:
+        get_parse_cache(options['cache']).commit()
+    remove_stale_outputs(version_num, previous_manifest, files)
+    save_manifest(version_num, {'fingerprint': fingerprint, 'output': output, 'files': files})
+    if previous_shard != None:
+        previous_shard.close()
+    remove_shard(previous_shard_path)
+    if journal != None:
+        journal.finish_version(version_num, [total_unstable_collected, total_unstable_exist], skip_counts)
+    print_version_totals(version_num, total_unstable_collected, total_unstable_exist, skip_counts)
+    return (total_unstable_collected, total_unstable_exist, skip_counts)
+
+
+def reparse_quarantined(source = 'directory', workers = 1, options = None):
+    '''
+    Parse again only the pages in the quarantine `options['quarantine']`, e.g. with a larger budget or after fixing the parser.
+    Outputs and manifests of their versions are updated, and version totals are printed again from the manifests.
+    Pages failing again stay in the quarantine.
+    '''
+    if options == None:
+        options = default_parse_options()
+    entries = load_quarantine(options['quarantine'])
+    versions = sorted(set(version_num for (version_num, _) in entries), key=lambda version_num: int(version_num.split('.')[1]))
+    remaining = list()
+    for version_num in versions:
+        i = int(version_num.split('.')[1])
+        relative_paths = set(relative_path for (entry_version, relative_path) in entries if entry_version == version_num)
+        manifest = load_manifest(version_num)
+        output = manifest['output'] if manifest != None else 'json'
+        shard_writer = ShardWriter(get_shard_path(get_version_directory(version_num)), 'a') if output == 'shard' else None
+        doc_source = get_doc_source(version_num, source)
+        crates = sorted(set(relative_path.split('/')[1] for relative_path in relative_paths))
+        units = ((relative_path, i, html_path, html_content, options) for (relative_path, html_path, html_content)
+            in doc_source.iter_units(crates) if relative_path in relative_paths)
+        for (relative_path, tuples, skip_reason, cache_key, source_hash, quarantine) in map_units(parse_html_unit, units, workers):
+            if quarantine != None:
+                print('Quarantined again ' + version_num + relative_path + ':', quarantine['reason'], quarantine['detail'])
+                remaining.append(get_quarantine_entry(version_num, relative_path, quarantine))
+                continue
+            if cache_key != None:
+                set_cached_parse(options['cache'], cache_key, tuples)
+            entry = {'hash': source_hash, 'skip': skip_reason, 'counts': None, 'output': None}
+            if tuples != None:
+                (submodule, collected_unstable_count, html_unstable_count) = tuples
+                store_submodule(version_num, relative_path, submodule, shard_writer)
+                entry['counts'] = [collected_unstable_count, html_unstable_count]
+                entry['output'] = get_output_location(version_num, relative_path, shard_writer)
+            if manifest == None:
+                continue
+            manifest['files'][relative_path] = entry
+            # Aliases of the page were not stored, as it had no result.
+            for (alias_path, alias_entry) in manifest['files'].items():
+                if alias_entry.get('alias_of') == relative_path and entry['counts'] != None:
+                    store_submodule(version_num, alias_path, get_alias_record(alias_path, relative_path), shard_writer)
+                    alias_entry['counts'] = entry['counts']
+                    alias_entry['output'] = get_output_location(version_num, alias_path, shard_writer)
+        if shard_writer != None:
+            shard_writer.close()
+        if options['cache'] != None:
+            get_parse_cache(options['cache']).commit()
+        if manifest == None:
+            continue
+        save_manifest(version_num, manifest)
+        skip_counts = dict()
+        for entry in manifest['files'].values():
+            if entry['skip'] != None:
+                skip_counts[entry['skip']] = skip_counts.get(entry['skip'], 0) + 1
+        print_version_totals(version_num, sum(entry['counts'][0] for entry in manifest['files'].values() if entry['counts'] != None),
+            sum(entry['counts'][1] for entry in manifest['files'].values() if entry['counts'] != None), skip_counts)
+    save_quarantine(options['quarantine'], remaining)
+
+
+# parse_all_docs(60,63)
+# crawl_rustdoc()
+# test_html_pre_types()
+# parse_all_docs()
+# print(div_class_set)
+# print_pretty(parse_html('/home/loancold/Projects/rustdoc_parser/1.52.0/rust-docs-nightly-x86_64-unknown-linux-gnu/rust-docs/share/doc/rust/html/core/result/struct.Iter.html', 52))
+def get_option(name, default = None):
+    '''
+    Read option `--name=value` from command line. Options can be placed anywhere after the command.
+    '''
+    for arg in sys.argv[1:]:
+        if arg.startswith('--' + name + '='):
+            return arg.split('=', 1)[1]
+    return default
+
+
+def has_flag(name) -> bool:
+    '''
+    Check if flag `--name` is given in command line.
+    '''
+    return '--' + name in sys.argv[1:]
+
+
+def get_command_line_options() -> dict:
+    '''
+    Return parse options (see `default_parse_options()`) given in command line.
+    '''
+    options = default_parse_options()
+    options['parser'] = get_option('parser', options['parser'])
+    options['read_bytes'] = has_flag('read_bytes')
+    options['scoped'] = has_flag('scoped')
+    options['extractor'] = get_option('extractor', options['extractor'])
+    options['classify'] = not has_flag('no_classify')
+    options['cache'] = get_option('cache', PARSE_CACHE_FILE if has_flag('cache') else None)
+    options['dedupe'] = has_flag('dedupe')
+    # `--parse_timeout=0` or `--parse_memory=0` disables the budget.
+    options['timeout'] = float(get_option('parse_timeout', PARSE_TIMEOUT)) or None
+    options['memory'] = int(float(get_option('parse_memory', PARSE_MEMORY / 2**20)) * 2**20) or None
+    options['quarantine'] = get_option('quarantine', QUARANTINE_FILE)
+    options['inventory'] = has_flag('inventory')
+    return options
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = get_command_line_options()
+    journal_path = get_option('journal', PARSE_JOURNAL_FILE if has_flag('journal') else None)
+    if args[0] == 'crawl':
+        crawl_rustdoc(int(get_option('workers', 8)), get_option('dist_url', DIST_URL), get_option('releases_url', RELEASES_URL), has_flag('stream'))
+    elif args[0] == 'complete':
+        parse_all_docs(source = get_option('source', 'directory'), browser_fallback = has_flag('browser'), workers = int(get_option('workers', 1)), options = options, output = get_option('output', 'json'), incremental = has_flag('incremental'), journal_path = journal_path)
+    elif args[0] == 'complete_selected':
+        parse_all_docs(int(args[1]), int(args[2]), get_option('source', 'directory'), has_flag('browser'), int(get_option('workers', 1)), options, get_option('output', 'json'), has_flag('incremental'), journal_path)
+    elif args[0] == 'reparse_quarantined':
+        # e.g. `python3 parse.py reparse_quarantined --parse_timeout=3600`
+        reparse_quarantined(get_option('source', 'directory'), int(get_option('workers', 1)), options)
+    elif args[0] == 'inventory':
+        # e.g. `python3 parse.py inventory 1 63`, then `--inventory` to parse only its pages.
+        build_inventories(int(args[1]), int(args[2]), get_option('source', 'directory'), has_flag('browser'))
+    elif args[0] == 'check_inventory':
+        check_inventories(int(args[1]), int(args[2]))
+    elif args[0] == 'test_search_index':
+        test_search_index_formats()
+    elif args[0] == 'journal_totals':
+        # Rebuild the totals `results.py` reads, from the journal of a run.
+        print_journal_totals(journal_path if journal_path != None else PARSE_JOURNAL_FILE)
+    elif args[0] == 'test_download':
+        test_download_resume()
+    elif args[0] == 'test_crawl':
+        test_crawl_rustdoc()
+    elif args[0] == 'compare_parsers':
+        # Compare default parsing with the parse options given in command line (e.g. `--parser=lxml --scoped`).
+        test_parser_backends(int(args[1]), int(args[2]), get_option('source', 'directory'), default_parse_options(), options)
+    elif args[0] == 'test_serial':
+        submodule = parse_html(args[1], int(args[2]), options = options)[0]
+        with open('test_serial.json', 'w') as file:
+            json.dump(submodule, file)
+    else:
+        print_pretty(parse_html(args[0], int(args[1]), options = options)[0])
 
 '''
 Found issue:
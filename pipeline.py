@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from parse import get_release_versions, download_version, extract_version, parse_version_docs, print_version_totals, \
+    print_progress, ParseJournal, get_command_line_options, get_option, has_flag, RELEASES_URL, DIST_URL, PARSE_JOURNAL_FILE
+
+
+# Run download -> extract -> parse -> plain per version, with the stages overlapped: version N+1 downloads while N is parsed
+# and N-1 is plained. Stages are threads passing versions through bounded queues, so a slow stage blocks the ones before it
+# (backpressure) rather than letting downloads fill the disk. The wall clock is about the time of the slowest stage.
+PIPELINE_QUEUE_SIZE = 2 # Versions waiting between two stages.
+
+
+class PipelineStage:
+    '''
+    A stage of the pipeline: `workers` threads taking versions from `input_queue`, applying `function`, and putting
+    its result into `output_queue`. A `None` result drops the version (e.g. a failed download).
+    The end of input is a `None` item, passed on when all workers of the stage are done.
+    Time of each worker is split into busy (running `function`), starved (waiting for input) and blocked (waiting for output room).
+    '''
+    def __init__(self, name, function, input_queue, output_queue, workers = 1):
+        self.name = name
+        self.function = function
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.running_workers = workers
+        self.stats = {'items': 0, 'failed': 0, 'busy': 0.0, 'starved': 0.0, 'blocked': 0.0}
+        self.threads = [threading.Thread(target=self.run, name=name) for i in range(workers)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def add_time(self, key, start_time) -> float:
+        now = time.time()
+        with self.lock:
+            self.stats[key] += now - start_time
+        return now
+
+    def run(self):
+        while True:
+            start_time = time.time()
+            item = self.input_queue.get()
+            start_time = self.add_time('starved', start_time)
+            if item == None:
+                self.input_queue.put(None) # For other workers of the stage.
+                break
+            try:
+                result = self.function(item)
+            except Exception as e:
+                print_progress('Stage', self.name, 'failed on', item, e)
+                result = None
+            start_time = self.add_time('busy', start_time)
+            with self.lock:
+                self.stats['items' if result != None else 'failed'] += 1
+            if result != None:
+                self.output_queue.put(result)
+                self.add_time('blocked', start_time)
+        with self.lock:
+            self.running_workers -= 1
+            if self.running_workers == 0:
+                self.output_queue.put(None)
+
+
+def print_pipeline_stats(stages, wall_time):
+    '''
+    Print time of each stage. Utilization is busy time over wall time of all its workers.
+    '''
+    print('Pipeline finished in', format(wall_time, '.1f'), 's')
+    print('stage', 'workers', 'items', 'failed', 'busy', 'starved', 'blocked', 'utilization', sep='\t')
+    for stage in stages:
+        stats = stage.stats
+        print(stage.name, stage.workers, stats['items'], stats['failed'], format(stats['busy'], '.1f'), format(stats['starved'], '.1f'),
+            format(stats['blocked'], '.1f'), format(stats['busy'] / (stage.workers * wall_time), '.2%'), sep='\t')
+
+
+def run_pipeline(MIN_VERSION = 1, MAX_VERSION = 63, source = 'directory', workers = 1, options = None, output = 'json', journal_path = None,
+    plain = True, download_workers = 2, queue_size = PIPELINE_QUEUE_SIZE, releases_url = RELEASES_URL, dist_url = DIST_URL, totals_path = None):
+    '''
+    Download, extract, parse and plain versions `1.MIN_VERSION.0` to `1.MAX_VERSION.0` in a pipeline (see above).
+    Parsing is the same as `parse_all_docs()`, with `workers` processes. With `source` 'archive', html files are read from
+    the archive (see `ArchiveDocSource`) and there is no extract stage. Plain results go to `all_docs.json`, the same as
+    analysis.py `plain_all_docs()`, in a process of its own so that it does not share the interpreter with the other stages.
+    Per-version totals are printed by the parse stage, and again to `totals_path` at the end, without other output in between.
+    '''
+    release_dates = dict(get_release_versions(releases_url))
+    journal = ParseJournal(journal_path) if journal_path != None else None
+    totals = dict()
+    docs = dict()
+    plain_executor = None
+
+    def download(i):
+        version_num = '1.' + str(i) + '.0'
+        return i if download_version(version_num, release_dates[version_num], dist_url) != 'failed' else None
+
+    def extract(i):
+        extract_version('1.' + str(i) + '.0')
+        return i
+
+    def parse(i):
+        totals[i] = parse_version_docs(i, source, False, workers, options, output, False, journal)
+        return i
+
+    def plain_version(i):
+        docs[i] = plain_executor.submit(plain_version_docs, i).result()
+        return i
+
+    steps = [('download', download, download_workers)]
+    if source != 'archive':
+        steps.append(('extract', extract, 1))
+    steps.append(('parse', parse, 1))
+    if plain:
+        # analysis.py needs pandas and matplotlib, which parse-only runs do not.
+        from analysis import plain_version_docs
+        plain_executor = ProcessPoolExecutor(1)
+        steps.append(('plain', plain_version, 1))
+    # Only queues between stages are bounded: all versions are queued for download up front.
+    queues = [queue.Queue()] + [queue.Queue(queue_size) for i in range(len(steps) - 1)] + [queue.Queue()]
+    stages = [PipelineStage(name, function, queues[index], queues[index+1], stage_workers) for (index, (name, function, stage_workers)) in enumerate(steps)]
+    start_time = time.time()
+    for stage in stages:
+        stage.start()
+    for i in range(MIN_VERSION, MAX_VERSION+1):
+        queues[0].put(i)
+    queues[0].put(None)
+    for stage in stages:
+        stage.join()
+    wall_time = time.time() - start_time
+    if plain_executor != None:
+        plain_executor.shutdown()
+    if journal != None:
+        journal.close()
+    if plain:
+        with open('all_docs.json', 'w') as file:
+            json.dump([docs.get(i, dict()) for i in range(MIN_VERSION, MAX_VERSION+1)], file)
+    failed = [i for i in range(MIN_VERSION, MAX_VERSION+1) if i not in totals]
+    if len(failed) != 0:
+        print('Failed versions:', ['1.' + str(i) + '.0' for i in failed])
+    if totals_path != None:
+        with open(totals_path, 'w') as file:
+            for i in sorted(totals):
+                print_version_totals('1.' + str(i) + '.0', *totals[i], file=file)
+    print_pipeline_stats(stages, wall_time)
+
+
+if __name__ == '__main__':
+    # Worker processes are started while stage threads run, so they must not be forked from this process.
+    multiprocessing.set_start_method('forkserver')
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    # e.g. `python3 pipeline.py 1 63 --workers=8 --totals=run.log`, with parse options of parse.py.
+    run_pipeline(int(args[0]), int(args[1]), get_option('source', 'directory'), int(get_option('workers', 1)), get_command_line_options(),
+        get_option('output', 'json'), get_option('journal', PARSE_JOURNAL_FILE if has_flag('journal') else None), not has_flag('no_plain'),
+        int(get_option('download_workers', 2)), int(get_option('queue_size', PIPELINE_QUEUE_SIZE)),
+        get_option('releases_url', RELEASES_URL), get_option('dist_url', DIST_URL), get_option('totals'))
@@ -0,0 +1,485 @@
+import json
+import os
+import sys
+import time
+import socket
+import threading
+import multiprocessing
+
+from parse import get_doc_source, get_parse_crates, get_version_directory, get_era_fingerprint, parse_html_unit, \
+    store_submodule, set_cached_parse, get_parse_cache, load_manifest, save_manifest, remove_stale_outputs, print_version_totals, write_json_file, \
+    get_json_file_path, get_command_line_options, get_option, has_flag, record_quarantine, \
+    load_inventory, build_inventory, get_inventory_pages, PARSE_TIMEOUT
+from shard import ShardReader, ShardWriter, get_shard_path, remove_shard, move_shard
+
+
+# Work queue of parse runs, shared by any number of worker processes on any number of hosts (on shared storage).
+# Versions are split into work units, which workers claim one by one, so that the load is balanced to the end of the run.
+# A queue is a directory:
+#   plan.json: the run (versions, options, output) and all units.
+#   waiting/: units whose dependencies are not done yet.
+#   todo/: units ready to run. Workers claim them in file name order, which is the order of decreasing cost.
+#   claimed/: units being run. A worker claims a unit by renaming it from `todo/`, which only one worker can do.
+#   done/: finished units, with the worker and its run time.
+#   parts/: results of units, merged by later units. Each run of a unit writes its own parts, named by its attempt (see `get_attempt_name()`):
+#     the done unit records the attempt whose parts count.
+# Units are:
+#   parse: html files of a crate of a version, split to `unit_size` bytes of html. It writes a part shard and the entries of its files.
+#   merge: merges the parse units of a version into its output (json files or shard), manifest and totals.
+#   plain: plains submodules of a crate of a version (see analysis.py `plain_all_docs()`), after its merge.
+#   collect: writes `all_docs.json` from all plain units.
+# Workers which died with a claimed unit are found by the unit file not being touched for `STALE_CLAIM_SECONDS`: the unit goes back to `todo/`.
+# A live worker touches its claim every `HEARTBEAT_SECONDS` from a thread, however long a page or a merge takes.
+# Claims and parts only need atomic renames, but appends and sqlite (WAL) locks are not safe across hosts on network filesystems:
+# each host keeps its own quarantine and parse cache (see `get_host_options()`). Hosts can put them on a local disk
+# with `work --cache=... --quarantine=...`, and pages quarantined by a host are parsed again with its quarantine file.
+QUEUE_DIRECTORY = 'parse_queue'
+QUEUE_STATES = ['waiting', 'todo', 'claimed', 'done', 'parts']
+UNIT_SIZE = 8 * 2**20 # Bytes of html in a parse unit.
+FILE_COST = 4096 # Cost of a html file besides its size, in bytes.
+PLAIN_COST_RATIO = 0.2 # Cost of plaining the submodules of a html file, relative to parsing it.
+STALE_CLAIM_SECONDS = 4 * PARSE_TIMEOUT # Well above the time budget of a page, see parse.py `parse_with_budget()`.
+HEARTBEAT_SECONDS = 30
+POLL_SECONDS = 2
+
+
+def get_unit_file_name(unit) -> str:
+    return '%06d-%s.json' % (unit['priority'], unit['id'])
+
+
+def get_part_path(queue_directory, unit_id, attempt, extension = '.json') -> str:
+    return queue_directory + '/parts/' + unit_id + '.' + attempt + extension
+
+
+def get_attempt_name(worker_name, started) -> str:
+    return worker_name.replace(':', '-') + '-' + str(int(started * 1000))
+
+
+def get_done_attempt(queue_directory, plan, unit_id) -> str:
+    '''
+    Return the attempt of a done unit, whose parts are the results of the unit.
+    '''
+    with open(queue_directory + '/done/' + get_unit_file_name(plan['units'][unit_id]), 'r') as file:
+        return json.load(file)['attempt']
+
+
+def remove_attempt_parts(queue_directory, unit_id, attempt):
+    prefix = unit_id + '.' + attempt + '.'
+    for file_name in os.listdir(queue_directory + '/parts'):
+        if file_name.startswith(prefix):
+            os.remove(queue_directory + '/parts/' + file_name)
+
+
+def split_files(relative_paths, sizes, unit_size = UNIT_SIZE) -> list:
+    '''
+    Split html files (in path order) into groups of about `unit_size` bytes. Files are kept in path order, so a group is a few modules.
+    '''
+    groups = [[]]
+    group_cost = 0
+    for relative_path in sorted(relative_paths):
+        if group_cost >= unit_size:
+            groups.append([])
+            group_cost = 0
+        groups[-1].append(relative_path)
+        group_cost += sizes[relative_path] + FILE_COST
+    return groups
+
+
+def plan_units(MIN_VERSION, MAX_VERSION, stages, unit_size = UNIT_SIZE, browser_fallback = False, inventory = False) -> list:
+    '''
+    Return all units of a run. Each unit is a dict of 'id', 'stage', 'version', 'cost' and 'after' (ids of units it depends on),
+    and 'files' for parse units, 'crate' for plain units. 'priority' ranks units by decreasing cost, so that small units
+    end the run. Merge and collect units are ranked first, as other units wait for them.
+    Set `inventory` to only parse pages in the inventory of each version (see parse.py `build_inventory()`).
+    '''
+    units = list()
+    merge_ids = list()
+    plain_ids = list()
+    for i in range(MIN_VERSION, MAX_VERSION+1):
+        version_num = '1.' + str(i) + '.0'
+        doc_source = get_doc_source(version_num)
+        parse_ids = list()
+        crate_costs = dict()
+        inventory_pages = None
+        if inventory:
+            version_inventory = load_inventory(version_num)
+            if version_inventory == None:
+                version_inventory = build_inventory(i, 'directory', browser_fallback)
+            inventory_pages = get_inventory_pages(version_inventory)
+        for crate in get_parse_crates(i, doc_source, browser_fallback):
+            relative_paths = doc_source.list_html([crate])
+            if inventory_pages != None:
+                relative_paths = [relative_path for relative_path in relative_paths if relative_path in inventory_pages]
+            sizes = {relative_path: os.path.getsize(doc_source.get_path(relative_path)) for relative_path in relative_paths}
+            crate_costs[crate] = sum(sizes.values()) + FILE_COST * len(relative_paths)
+            for (index, files) in enumerate(split_files(relative_paths, sizes, unit_size)):
+                if len(files) == 0:
+                    continue
+                unit_id = 'parse-' + version_num + '-' + crate + '-' + str(index)
+                units.append({'id': unit_id, 'stage': 'parse', 'version': i, 'files': files, 'after': [],
+                    'cost': sum(sizes[relative_path] + FILE_COST for relative_path in files)})
+                parse_ids.append(unit_id)
+        merge_id = 'merge-' + version_num
+        units.append({'id': merge_id, 'stage': 'merge', 'version': i, 'after': parse_ids, 'cost': 0, 'parse_units': parse_ids})
+        merge_ids.append(merge_id)
+        if 'plain' not in stages:
+            continue
+        for (crate, cost) in crate_costs.items():
+            unit_id = 'plain-' + version_num + '-' + crate
+            units.append({'id': unit_id, 'stage': 'plain', 'version': i, 'crate': crate, 'after': [merge_id], 'cost': cost * PLAIN_COST_RATIO})
+            plain_ids.append(unit_id)
+    if 'plain' in stages:
+        units.append({'id': 'collect', 'stage': 'collect', 'version': None, 'after': merge_ids + plain_ids, 'cost': 0, 'plain_units': plain_ids})
+    for (priority, unit) in enumerate(sorted(units, key=lambda unit: (unit['stage'] not in ['merge', 'collect'], -unit['cost'], unit['id']))):
+        unit['priority'] = priority
+    return units
+
+
+def plan_queue(MIN_VERSION = 1, MAX_VERSION = 63, queue_directory = QUEUE_DIRECTORY, options = None, output = 'json', stages = None, unit_size = UNIT_SIZE, browser_fallback = False):
+    '''
+    Create a queue (see above) to parse versions `1.MIN_VERSION.0` to `1.MAX_VERSION.0` from extracted directories.
+    @Input `stages` is ['parse'] or ['parse', 'plain'].
+    Units of a run are independent of each other, so dedupe (`--dedupe`) and archives (`--source=archive`) are not supported.
+    '''
+    if stages == None:
+        stages = ['parse']
+    assert not options['dedupe'], 'Dedupe needs all crates of a version in one unit, run parse.py instead'
+    if os.path.exists(queue_directory + '/plan.json'):
+        raise Exception('Queue is already planned: ' + queue_directory)
+    units = plan_units(MIN_VERSION, MAX_VERSION, stages, unit_size, browser_fallback, options['inventory'])
+    for state in QUEUE_STATES:
+        os.makedirs(queue_directory + '/' + state, exist_ok=True)
+    plan = {'min_version': MIN_VERSION, 'max_version': MAX_VERSION, 'options': options, 'output': output, 'stages': stages, 'units': units}
+    write_json_file(queue_directory + '/plan.json', plan)
+    # Units are added after the plan, so workers always find it.
+    for unit in units:
+        write_json_file(queue_directory + '/' + ('todo' if len(unit['after']) == 0 else 'waiting') + '/' + get_unit_file_name(unit), unit)
+    print('Planned', len(units), 'units in', queue_directory)
+
+
+def load_plan(queue_directory) -> dict:
+    with open(queue_directory + '/plan.json', 'r') as file:
+        plan = json.load(file)
+    plan['units'] = {unit['id']: unit for unit in plan['units']}
+    return plan
+
+
+def list_units(queue_directory, state) -> list:
+    '''
+    Return file names of units in `state`, in claim order. Files being written (`.partial`) are not units yet.
+    '''
+    return sorted(file_name for file_name in os.listdir(queue_directory + '/' + state) if file_name.endswith('.json'))
+
+
+def get_worker_name() -> str:
+    return socket.gethostname() + ':' + str(os.getpid())
+
+
+def claim_unit(queue_directory) -> str:
+    '''
+    Claim the first unit in `todo/`. Return its file name, or `None` if there is no unit to claim.
+    '''
+    for file_name in list_units(queue_directory, 'todo'):
+        try:
+            os.rename(queue_directory + '/todo/' + file_name, queue_directory + '/claimed/' + file_name)
+        except FileNotFoundError:
+            continue # Claimed by another worker.
+        touch_claim(queue_directory, file_name)
+        return file_name
+    return None
+
+
+def touch_claim(queue_directory, file_name):
+    '''
+    Show a claimed unit is still being run, see `requeue_stale_units()`.
+    '''
+    try:
+        os.utime(queue_directory + '/claimed/' + file_name)
+    except FileNotFoundError:
+        pass # Requeued, the unit is run again by someone else.
+
+
+def heartbeat_claim(queue_directory, file_name, stop_event, interval = HEARTBEAT_SECONDS):
+    '''
+    Touch a claimed unit every `interval` seconds until `stop_event` is set. Run in a thread while the unit is run.
+    '''
+    while not stop_event.wait(interval):
+        touch_claim(queue_directory, file_name)
+
+
+def requeue_stale_units(queue_directory, stale_seconds = STALE_CLAIM_SECONDS) -> int:
+    '''
+    Move claimed units not touched for `stale_seconds` back to `todo/`. Return how many are requeued.
+    Units being finished (see `finish_unit()`) are requeued too, if their worker died before moving them to `done/`.
+    '''
+    count = 0
+    for claimed_name in os.listdir(queue_directory + '/claimed'):
+        if '.json' not in claimed_name:
+            continue
+        file_name = claimed_name[:claimed_name.index('.json') + len('.json')]
+        claimed_path = queue_directory + '/claimed/' + claimed_name
+        try:
+            if time.time() - os.path.getmtime(claimed_path) < stale_seconds:
+                continue
+            os.rename(claimed_path, queue_directory + '/todo/' + file_name)
+        except FileNotFoundError:
+            continue
+        print('Requeued stale unit', file_name)
+        count += 1
+    return count
+
+
+def finish_unit(queue_directory, unit, file_name) -> bool:
+    '''
+    Move a run unit to `done/`, with its worker, attempt and run time. Return `False` if its claim was lost.
+    The claim is first renamed to a name of this attempt, which fails if the unit was requeued, so a unit is only done once,
+    and `done/` only ever has whole unit files.
+    '''
+    finishing_path = queue_directory + '/claimed/' + file_name + '.' + unit['attempt']
+    try:
+        os.rename(queue_directory + '/claimed/' + file_name, finishing_path)
+    except FileNotFoundError:
+        return False # Requeued while it was run, and run again by another worker.
+    write_json_file(queue_directory + '/done/' + file_name, unit)
+    os.remove(finishing_path)
+    return True
+
+
+def release_units(queue_directory, plan, unit):
+    '''
+    Move waiting units which depend on `unit` to `todo/`, if all their dependencies are done.
+    Each worker checks after its unit is in `done/`, so the last of the dependencies always releases them.
+    '''
+    done_file_names = set(list_units(queue_directory, 'done'))
+    for waiting_unit in plan['units'].values():
+        if unit['id'] not in waiting_unit['after']:
+            continue
+        if not all(get_unit_file_name(plan['units'][unit_id]) in done_file_names for unit_id in waiting_unit['after']):
+            continue
+        file_name = get_unit_file_name(waiting_unit)
+        try:
+            os.rename(queue_directory + '/waiting/' + file_name, queue_directory + '/todo/' + file_name)
+        except FileNotFoundError:
+            pass # Released by another worker.
+
+
+def run_parse_unit(queue_directory, plan, unit, attempt):
+    '''
+    Parse html files of a unit. Submodules go to json files (`--output=json`) or to a part shard, merged by the merge unit.
+    Manifest entries of the files (see parse.py `load_manifest()`) go to the part of the unit.
+    '''
+    options = plan['options']
+    version_num = '1.' + str(unit['version']) + '.0'
+    doc_source = get_doc_source(version_num)
+    shard_writer = None
+    part_shard_path = get_part_path(queue_directory, unit['id'], attempt, '.jsonl.gz')
+    partial_shard_path = get_part_path(queue_directory, unit['id'], attempt, '.partial.jsonl.gz')
+    if plan['output'] == 'shard':
+        shard_writer = ShardWriter(partial_shard_path)
+    files = dict()
+    for relative_path in unit['files']:
+        (_, tuples, skip_reason, cache_key, source_hash, quarantine) = parse_html_unit((relative_path, unit['version'], doc_source.get_path(relative_path), None, options))
+        if quarantine != None:
+            record_quarantine(options['quarantine'], version_num, relative_path, quarantine)
+        if cache_key != None:
+            set_cached_parse(options['cache'], cache_key, tuples)
+        files[relative_path] = {'hash': source_hash, 'skip': skip_reason, 'counts': None, 'output': None}
+        if tuples != None:
+            (submodule, collected_unstable_count, html_unstable_count) = tuples
+            store_submodule(version_num, relative_path, submodule, shard_writer)
+            files[relative_path]['counts'] = [collected_unstable_count, html_unstable_count]
+            files[relative_path]['output'] = os.path.basename(get_shard_path(get_version_directory(version_num))) if shard_writer != None \
+                else os.path.relpath(get_json_file_path(version_num, relative_path), get_version_directory(version_num))
+    if shard_writer != None:
+        shard_writer.close()
+        move_shard(partial_shard_path, part_shard_path)
+    if options['cache'] != None:
+        get_parse_cache(options['cache']).commit()
+    write_json_file(get_part_path(queue_directory, unit['id'], attempt), {'files': files})
+
+
+def run_merge_unit(queue_directory, plan, unit, attempt):
+    '''
+    Merge parse units of a version: its shard (`--output=shard`), manifest and totals, as `parse_all_docs()` writes them.
+    '''
+    version_num = '1.' + str(unit['version']) + '.0'
+    shard_path = get_shard_path(get_version_directory(version_num))
+    remove_shard(shard_path)
+    shard_writer = ShardWriter(shard_path) if plan['output'] == 'shard' else None
+    files = dict()
+    for unit_id in unit['parse_units']:
+        parse_attempt = get_done_attempt(queue_directory, plan, unit_id)
+        with open(get_part_path(queue_directory, unit_id, parse_attempt), 'r') as file:
+            files.update(json.load(file)['files'])
+        if shard_writer != None:
+            for (relative_path, submodule) in ShardReader(get_part_path(queue_directory, unit_id, parse_attempt, '.jsonl.gz')):
+                shard_writer.write(relative_path, submodule)
+    if shard_writer != None:
+        shard_writer.close()
+    totals = [0, 0]
+    skip_counts = dict()
+    for entry in files.values():
+        if entry['skip'] != None:
+            skip_counts[entry['skip']] = skip_counts.get(entry['skip'], 0) + 1
+        if entry['counts'] != None:
+            totals = [totals[0] + entry['counts'][0], totals[1] + entry['counts'][1]]
+    remove_stale_outputs(version_num, load_manifest(version_num), files)
+    save_manifest(version_num, {'fingerprint': get_era_fingerprint(unit['version'], plan['options']), 'output': plan['output'], 'files': files})
+    write_json_file(get_part_path(queue_directory, unit['id'], attempt), {'totals': totals, 'skip_counts': skip_counts})
+
+
+def run_plain_unit(queue_directory, plan, unit, attempt):
+    '''
+    Plain submodules of a crate of a version, see analysis.py `plain_all_docs()`.
+    '''
+    # analysis.py needs pandas and matplotlib, which parse-only runs do not.
+    from analysis import get_submodule_reader, plain_submodule
+    version_num = '1.' + str(unit['version']) + '.0'
+    submodule_reader = get_submodule_reader(get_version_directory(version_num))
+    submodule_map = dict()
+    for relative_path in sorted(submodule_reader.keys()):
+        if not relative_path.startswith('/' + unit['crate'] + '/'):
+            continue
+        (submodule_path, submodule_plain) = plain_submodule(submodule_reader, submodule_reader.get(relative_path))
+        submodule_map[submodule_path] = submodule_plain
+    write_json_file(get_part_path(queue_directory, unit['id'], attempt), submodule_map)
+
+
+def run_collect_unit(queue_directory, plan, unit, attempt):
+    '''
+    Write `all_docs.json` (see analysis.py `plain_all_docs()`) from plain units, in version order.
+    '''
+    docs = [dict() for i in range(plan['min_version'], plan['max_version']+1)]
+    for unit_id in unit['plain_units']:
+        with open(get_part_path(queue_directory, unit_id, get_done_attempt(queue_directory, plan, unit_id)), 'r') as file:
+            docs[plan['units'][unit_id]['version'] - plan['min_version']].update(json.load(file))
+    write_json_file(os.getcwd() + '/all_docs.json', docs)
+
+
+UNIT_RUNNERS = {
+    'parse': run_parse_unit,
+    'merge': run_merge_unit,
+    'plain': run_plain_unit,
+    'collect': run_collect_unit,
+}
+
+
+def get_host_path(path, host_name = None) -> str:
+    '''
+    Return `path` with the host name before its extension, e.g. `quarantine.jsonl` -> `quarantine.<host>.jsonl`.
+    '''
+    (root, extension) = os.path.splitext(path)
+    return root + '.' + (host_name or socket.gethostname()) + extension
+
+
+def get_host_options(options, cache_path = None, quarantine_path = None) -> dict:
+    '''
+    Return parse options of the plan with the quarantine and parse cache of this host: `cache_path` and `quarantine_path` if given,
+    else the paths of the plan named by `get_host_path()`.
+    '''
+    options = dict(options)
+    if cache_path != None:
+        options['cache'] = cache_path
+    elif options['cache'] != None:
+        options['cache'] = get_host_path(options['cache'])
+    options['quarantine'] = quarantine_path if quarantine_path != None else get_host_path(options['quarantine'])
+    return options
+
+
+def run_worker(queue_directory = QUEUE_DIRECTORY, stale_seconds = STALE_CLAIM_SECONDS, cache_path = None, quarantine_path = None):
+    '''
+    Run units of the queue until all are done. Parse units use the quarantine and parse cache of this host (see `get_host_options()`).
+    '''
+    plan = load_plan(queue_directory)
+    plan['options'] = get_host_options(plan['options'], cache_path, quarantine_path)
+    worker_name = get_worker_name()
+    while True:
+        file_name = claim_unit(queue_directory)
+        if file_name == None:
+            if all(len(list_units(queue_directory, state)) == 0 for state in ['waiting', 'todo']) and len(os.listdir(queue_directory + '/claimed')) == 0:
+                return
+            if requeue_stale_units(queue_directory, stale_seconds) == 0:
+                time.sleep(POLL_SECONDS)
+            continue
+        with open(queue_directory + '/claimed/' + file_name, 'r') as file:
+            unit = json.load(file)
+        started = time.time()
+        unit.update({'worker': worker_name, 'attempt': get_attempt_name(worker_name, started)})
+        stop_event = threading.Event()
+        heartbeat = threading.Thread(target=heartbeat_claim, args=(queue_directory, file_name, stop_event, min(HEARTBEAT_SECONDS, stale_seconds / 4)), daemon=True)
+        heartbeat.start()
+        try:
+            UNIT_RUNNERS[unit['stage']](queue_directory, plan, unit, unit['attempt'])
+        finally:
+            stop_event.set()
+            heartbeat.join()
+        unit.update({'started': started, 'finished': time.time()})
+        if not finish_unit(queue_directory, unit, file_name):
+            print('Lost claim of unit', file_name)
+            remove_attempt_parts(queue_directory, unit['id'], unit['attempt'])
+            continue
+        release_units(queue_directory, plan, unit)
+
+
+def run_workers(queue_directory = QUEUE_DIRECTORY, workers = 1, stale_seconds = STALE_CLAIM_SECONDS, cache_path = None, quarantine_path = None):
+    '''
+    Run `workers` worker processes on this host. Other hosts can run theirs on the same queue.
+    '''
+    processes = [multiprocessing.Process(target=run_worker, args=(queue_directory, stale_seconds, cache_path, quarantine_path)) for i in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def print_queue_status(queue_directory = QUEUE_DIRECTORY):
+    '''
+    Print units in each state, and how busy workers were: time running units over time between their first and last unit.
+    '''
+    for state in QUEUE_STATES[:-1]:
+        print(state, len(list_units(queue_directory, state)))
+    worker_spans = dict() # worker -> [first start, last finish, busy time]
+    for file_name in list_units(queue_directory, 'done'):
+        with open(queue_directory + '/done/' + file_name, 'r') as file:
+            unit = json.load(file)
+        span = worker_spans.setdefault(unit['worker'], [unit['started'], unit['finished'], 0])
+        span[0] = min(span[0], unit['started'])
+        span[1] = max(span[1], unit['finished'])
+        span[2] += unit['finished'] - unit['started']
+    if len(worker_spans) == 0:
+        return
+    run_start = min(span[0] for span in worker_spans.values())
+    run_end = max(span[1] for span in worker_spans.values())
+    busy_time = sum(span[2] for span in worker_spans.values())
+    print('workers', len(worker_spans), 'run seconds', format(run_end - run_start, '.1f'), 'busy', format(busy_time / (len(worker_spans) * (run_end - run_start)), '.2%'))
+
+
+def print_queue_totals(queue_directory = QUEUE_DIRECTORY):
+    '''
+    Print totals of merged versions, the same way `parse_all_docs()` prints them.
+    '''
+    plan = load_plan(queue_directory)
+    for i in range(plan['min_version'], plan['max_version']+1):
+        version_num = '1.' + str(i) + '.0'
+        if not os.path.exists(queue_directory + '/done/' + get_unit_file_name(plan['units']['merge-' + version_num])):
+            continue
+        with open(get_part_path(queue_directory, 'merge-' + version_num, get_done_attempt(queue_directory, plan, 'merge-' + version_num)), 'r') as file:
+            part = json.load(file)
+        print_version_totals(version_num, part['totals'][0], part['totals'][1], part['skip_counts'])
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    queue_directory = get_option('queue', QUEUE_DIRECTORY)
+    if args[0] == 'plan':
+        # e.g. `python3 scheduler.py plan 1 63 --output=shard --stages=parse,plain`, with parse options of parse.py.
+        plan_queue(int(args[1]), int(args[2]), queue_directory, get_command_line_options(), get_option('output', 'json'),
+            get_option('stages', 'parse').split(','), int(float(get_option('unit_size', UNIT_SIZE / 2**20)) * 2**20), has_flag('browser'))
+    elif args[0] == 'work':
+        # e.g. `python3 scheduler.py work --workers=8 --cache=/tmp/parse_cache.sqlite`, with the quarantine and cache on a local disk.
+        run_workers(queue_directory, int(get_option('workers', 1)), int(get_option('stale', STALE_CLAIM_SECONDS)),
+            get_option('cache', None), get_option('quarantine', None))
+    elif args[0] == 'status':
+        print_queue_status(queue_directory)
+    elif args[0] == 'totals':
+        print_queue_totals(queue_directory)
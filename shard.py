@@ -0,0 +1,159 @@
+import json
+import gzip
+import zlib
+import os
+
+
+# Packed output of a version: one shard file instead of one json file per html page.
+# A shard is a JSONL file of records `{"key": ..., "data": ...}`, with an index file of `key offset length` lines.
+# Compressed shards (`.gz`) store each record as its own gzip member, so the whole file is still a valid gzip stream,
+# and a record can be read alone from its offset. Members have no time in their header, so equal records give equal bytes.
+SHARD_FILE_NAME = 'submodules.jsonl.gz'
+
+
+def get_shard_path(version_directory, compress = True) -> str:
+    return version_directory + '/' + (SHARD_FILE_NAME if compress else SHARD_FILE_NAME[:-len('.gz')])
+
+
+def get_index_path(shard_path) -> str:
+    return shard_path + '.idx'
+
+
+def is_compressed(shard_path) -> bool:
+    return shard_path.endswith('.gz')
+
+
+def remove_shard(shard_path):
+    for path in [shard_path, get_index_path(shard_path)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def truncate_shard(shard_path, offsets):
+    '''
+    Cut the shard and its index back to `offsets` returned by `ShardWriter.flush()`, dropping records written after it.
+    '''
+    (offset, index_offset) = offsets
+    with open(shard_path, 'r+b') as file:
+        file.truncate(offset)
+    with open(get_index_path(shard_path), 'r+b') as index_file:
+        index_file.truncate(index_offset)
+
+
+def move_shard(shard_path, new_shard_path):
+    os.replace(shard_path, new_shard_path)
+    os.replace(get_index_path(shard_path), get_index_path(new_shard_path))
+
+
+class ShardWriter:
+    '''
+    Append-only shard writer. Records are written one by one, each followed by its index line.
+    If a key is written twice, the index points to the last record.
+    @Input `mode` is 'w' to start a new shard or 'a' to append to an existing one.
+    '''
+    def __init__(self, shard_path, mode = 'w'):
+        assert mode in ['w', 'a'], 'Unknown shard mode ' + mode
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+        self.shard_path = shard_path
+        self.compress = is_compressed(shard_path)
+        self.file = open(shard_path, mode + 'b')
+        self.index_file = open(get_index_path(shard_path), mode)
+        self.offset = self.file.tell()
+
+    def write(self, key, data):
+        record = (json.dumps({'key': key, 'data': data}) + '\n').encode('utf-8')
+        if self.compress:
+            record = gzip.compress(record, mtime=0)
+        self.file.write(record)
+        self.index_file.write(json.dumps(key) + ' ' + str(self.offset) + ' ' + str(len(record)) + '\n')
+        self.offset += len(record)
+
+    def flush(self):
+        '''
+        Write records so far to disk (with fsync). Return (offset, index_offset) to `truncate_shard()` back to.
+        '''
+        for file in [self.file, self.index_file]:
+            file.flush()
+            os.fsync(file.fileno())
+        return (self.offset, self.index_file.tell())
+
+    def close(self):
+        # Records go to disk before the index, so the index never points past the end of the shard.
+        self.file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ShardReader:
+    '''
+    Read a shard either as a stream of (key, data) in write order (`iter(reader)`), or by key with the index (`reader.get(key)`).
+    Reading by key keeps the shard open until `close()`.
+    '''
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        self.compress = is_compressed(shard_path)
+        self.index = None
+        self.file = None
+
+    def __iter__(self):
+        opener = gzip.open if self.compress else open
+        with opener(self.shard_path, 'rb') as file:
+            try:
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break # Record cut by an interrupted writer.
+                    record = json.loads(line)
+                    yield (record['key'], record['data'])
+            except EOFError:
+                return # Gzip member cut by an interrupted writer.
+
+    def load_index(self) -> dict:
+        '''
+        Return key -> (offset, length). Later records of the same key replace earlier ones.
+        '''
+        if self.index == None:
+            self.index = dict()
+            with open(get_index_path(self.shard_path), 'r') as index_file:
+                for line in index_file:
+                    (key, offset, length) = line.rsplit(' ', 2)
+                    self.index[json.loads(key)] = (int(offset), int(length))
+        return self.index
+
+    def keys(self) -> list:
+        return list(self.load_index().keys())
+
+    def __contains__(self, key) -> bool:
+        return key in self.load_index()
+
+    def get(self, key):
+        '''
+        Return data of `key`, or `None` if it is not in the shard.
+        '''
+        index = self.load_index()
+        if key not in index:
+            return None
+        (offset, length) = index[key]
+        if self.file == None:
+            self.file = open(self.shard_path, 'rb')
+        self.file.seek(offset)
+        record = self.file.read(length)
+        if self.compress:
+            record = zlib.decompress(record, 16 + zlib.MAX_WBITS)
+        return json.loads(record)['data']
+
+    def close(self):
+        if self.file != None:
+            self.file.close()
+            self.file = None
+        self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()